@@ -0,0 +1,403 @@
+import asm_parser
+from seq import ESP, SEQ, jump_conditions, opcode_names, opcodes
+from utils import regfile
+
+ALL_REGISTERS = frozenset(range(16))
+
+
+def uses_defines(opcode: int, loper: int, roper: int) -> tuple[frozenset, frozenset]:
+    """
+        Function for getting registers read and written by instruction
+        def uses_defines(opcode: int, loper: int, roper: int) -> tuple[frozenset, frozenset]
+
+        call and ret are treated as reading every register, callee (or caller) may use them.
+        halt reads every register as well, they are the result of the program.
+    """
+    if opcode == opcodes.movrr:
+        return frozenset([roper]), frozenset([loper])
+    elif opcode in [opcodes.movrm, opcodes.movri]:
+        return frozenset(), frozenset([loper])
+    elif opcode == opcodes.movmr:
+        return frozenset([roper]), frozenset()
+    elif opcode in [opcodes.addrr, opcodes.subrr]:
+        return frozenset([loper, roper]), frozenset([loper])
+    elif opcode in [opcodes.addri, opcodes.subri, opcodes.addrm, opcodes.subrm]:
+        return frozenset([loper]), frozenset([loper])
+    elif opcode in [opcodes.addmr, opcodes.submr]:
+        return frozenset([roper]), frozenset()
+    elif opcode == opcodes.push:
+        return frozenset([loper, ESP]), frozenset([ESP])
+    elif opcode == opcodes.pop:
+        return frozenset([ESP]), frozenset([loper, ESP])
+    elif opcode in [opcodes.call, opcodes.ret]:
+        return ALL_REGISTERS, frozenset([ESP])
+    elif opcode == opcodes.halt:
+        return ALL_REGISTERS, frozenset()  # registers are the result of the program
+    return frozenset(), frozenset()
+
+
+class Instruction(object):
+    """
+        Decoded instruction of analysed program
+    """
+    __slots__ = ('address', 'opcode', 'loper', 'roper', 'next_address')
+
+    def __init__(self, address: int, opcode: int, loper: int, roper: int, next_address: int) -> None:
+        self.address = address
+        self.opcode = opcode
+        self.loper = loper
+        self.roper = roper
+        self.next_address = next_address
+
+    def is_terminator(self) -> bool:
+        return self.opcode in [opcodes.jp, opcodes.call, opcodes.ret, opcodes.halt] or self.opcode in jump_conditions
+
+    def targets(self) -> list[int]:
+        """
+            Function for getting addresses control can go to inside of the function
+        """
+        if self.opcode == opcodes.jp:
+            return [self.loper]
+        elif self.opcode in jump_conditions:
+            return [self.loper, self.next_address]
+        elif self.opcode == opcodes.call:
+            return [self.next_address]  # return site
+        elif self.opcode in [opcodes.ret, opcodes.halt]:
+            return []
+        return [self.next_address]
+
+
+class BasicBlock(object):
+    """
+        Straight line sequence of instructions with one entry and one exit
+    """
+
+    def __init__(self, start: int) -> None:
+        self.start: int = start
+        self.instructions: list[Instruction] = []
+        self.successors: list[int] = []     # start addresses of successor blocks
+        self.predecessors: list[int] = []
+        self.calls: list[int] = []          # called function addresses
+        self.live_in: frozenset = frozenset()
+        self.live_out: frozenset = frozenset()
+        self.loop_depth: int = 0
+
+    @property
+    def end(self) -> int:
+        return self.instructions[-1].next_address
+
+    def __repr__(self) -> str:
+        return 'BasicBlock({:#x}-{:#x} -> {})'.format(self.start, self.end, [hex(s) for s in self.successors])
+
+
+class Loop(object):
+    """
+        Natural loop: head block and all blocks of the loop body (head included)
+    """
+
+    def __init__(self, head: int, body: set[int]) -> None:
+        self.head: int = head
+        self.body: set[int] = body
+        self.parent: Loop | None = None
+        self.depth: int = 1
+
+    def __repr__(self) -> str:
+        return 'Loop(head={:#x}, blocks={}, depth={})'.format(self.head, len(self.body), self.depth)
+
+
+class ControlFlowGraph(object):
+    """
+        Control flow graph of assembled program.
+
+        Built from memory of computer starting at entry (program counter by default),
+        jump targets (address_points), functions (functions_addresses) and every
+        instruction slot (text_sections) of the last program assembled by asm_parser,
+        so code after jp, ret or halt forms unreachable blocks too. Blocks end at jp,
+        jcc, call, ret and halt.
+        After construction the graph has:
+            blocks          - start address -> BasicBlock
+            unreachable     - start addresses of blocks not reachable from entry
+            loops           - natural loops with nesting (parent, depth)
+            loop_heads      - start addresses of loop heads
+            problems        - obviously broken places of the program
+        Register liveness is stored in live_in/live_out of every block.
+    """
+
+    def __init__(self, computer: SEQ, entry: int | None = None, labels: dict[str, int] | None = None, functions: dict[str, int] | None = None, code: list[int] | None = None) -> None:
+        self.computer: SEQ = computer
+        self.entry: int = computer.PC if entry is None else entry
+        self.labels: dict[str, int] = dict(
+            asm_parser.address_points if labels is None else labels)
+        self.functions: dict[str, int] = dict(
+            asm_parser.functions_addresses if functions is None else functions)
+        if code is None:
+            code = [address for section in asm_parser.text_sections
+                    for address in section.addresses()]
+        self.code: list[int] = code  # addresses of assembled instructions
+
+        self.instructions: dict[int, Instruction] = {}
+        self.blocks: dict[int, BasicBlock] = {}
+        self.problems: list[str] = []
+        self.unreachable: list[int] = []
+        self.loops: list[Loop] = []
+        self.loop_heads: set[int] = set()
+
+        self.decode()
+        self.build_blocks()
+        self.find_unreachable()
+        self.compute_liveness()
+        self.find_loops()
+
+    def decode(self) -> None:
+        """
+            Function for decoding every instruction reachable from entry, labels, functions
+            and assembled instruction slots
+
+            Slots no decoded instruction falls through into (code after a terminator)
+            start blocks.
+        """
+        roots = [self.entry] + list(self.functions.values()) + \
+            [address for address in self.labels.values() if address >= 0]
+        self.leaders: set[int] = set(roots)
+        worklist = roots + self.code
+        while worklist:
+            address = worklist.pop()
+            if address in self.instructions:
+                continue
+            if address < 0 or address >= self.computer.memsize:
+                self.problems.append(
+                    'Control goes outside of memory: {:#x}'.format(address))
+                continue
+            opcode, loper, roper, next_address = self.computer.decode_instruction(
+                address)
+            instruction = Instruction(
+                address, opcode, loper, roper, next_address)
+            self.instructions[address] = instruction
+            if opcode not in opcode_names:
+                self.problems.append(
+                    'Unknown opcode {:#x} at {:#x}'.format(opcode, address))
+            targets = instruction.targets()
+            if opcode == opcodes.call:
+                targets = targets + [loper]
+                self.leaders.add(loper)
+            if instruction.is_terminator():
+                self.leaders.update(targets)
+            worklist.extend(targets)
+        falls = set(instruction.next_address for instruction in self.instructions.values()
+                    if not instruction.is_terminator())
+        self.leaders.update(address for address in self.code
+                            if address in self.instructions and address not in falls)
+
+    def build_blocks(self) -> None:
+        """
+            Function for splitting decoded instructions into basic blocks
+        """
+        for leader in sorted(self.leaders):
+            if leader not in self.instructions:
+                continue
+            block = BasicBlock(leader)
+            address = leader
+            while True:
+                instruction = self.instructions[address]
+                block.instructions.append(instruction)
+                if instruction.is_terminator():
+                    break
+                address = instruction.next_address
+                if address in self.leaders or address not in self.instructions:
+                    break
+            last = block.instructions[-1]
+            block.successors = [target for target in last.targets()
+                                if target in self.instructions]
+            if last.opcode == opcodes.call:
+                block.calls.append(last.loper)
+            self.blocks[leader] = block
+        for block in self.blocks.values():
+            for successor in block.successors:
+                self.blocks[successor].predecessors.append(block.start)
+
+    def find_unreachable(self) -> None:
+        """
+            Function for finding blocks not reachable from entry (calls are followed)
+        """
+        seen = set()
+        worklist = [self.entry]
+        while worklist:
+            start = worklist.pop()
+            if start in seen or start not in self.blocks:
+                continue
+            seen.add(start)
+            block = self.blocks[start]
+            worklist.extend(block.successors)
+            worklist.extend(block.calls)
+        self.reachable: set[int] = seen
+        self.unreachable = sorted(set(self.blocks) - seen)
+
+        halts = [start for start in seen
+                 if self.blocks[start].instructions[-1].opcode == opcodes.halt]
+        if self.entry in self.blocks and not halts:
+            self.problems.append('halt is not reachable from entry')
+
+    def compute_liveness(self) -> None:
+        """
+            Function for computing registers live at the beginning and end of every block
+        """
+        use_def = {}
+        for start, block in self.blocks.items():
+            use, define = set(), set()
+            for instruction in block.instructions:
+                reads, writes = uses_defines(
+                    instruction.opcode, instruction.loper, instruction.roper)
+                use |= reads - define
+                define |= writes
+            use_def[start] = (frozenset(use), frozenset(define))
+        changed = True
+        while changed:
+            changed = False
+            for start in sorted(self.blocks, reverse=True):
+                block = self.blocks[start]
+                live_out = frozenset().union(
+                    *[self.blocks[s].live_in for s in block.successors])
+                use, define = use_def[start]
+                live_in = use | (live_out - define)
+                if live_in != block.live_in or live_out != block.live_out:
+                    block.live_in, block.live_out = live_in, live_out
+                    changed = True
+
+    def dead_stores(self) -> list[Instruction]:
+        """
+            Function for finding reachable mov instructions whose register result is never read
+        """
+        dead = []
+        for start in sorted(self.reachable):
+            block = self.blocks[start]
+            live = set(block.live_out)
+            for instruction in reversed(block.instructions):
+                reads, writes = uses_defines(
+                    instruction.opcode, instruction.loper, instruction.roper)
+                # ALU results also set flags, push/pop/call/ret move stack pointer and memory
+                pure = instruction.opcode in [
+                    opcodes.movrr, opcodes.movrm, opcodes.movri]
+                if pure and not (writes & live):
+                    dead.append(instruction)
+                live -= writes
+                live |= reads
+        return sorted(dead, key=lambda instruction: instruction.address)
+
+    def dominators(self) -> dict[int, set[int]]:
+        """
+            Function for computing dominators of every reachable block
+            (every function is a separate root)
+        """
+        roots = set([self.entry]) | set(
+            callee for block in self.blocks.values() for callee in block.calls)
+        nodes = [start for start in sorted(self.reachable)]
+        dominators = {}
+        for start in nodes:
+            dominators[start] = set([start]) if start in roots else set(nodes)
+        changed = True
+        while changed:
+            changed = False
+            for start in nodes:
+                if start in roots:
+                    continue
+                predecessors = [p for p in self.blocks[start].predecessors
+                                if p in self.reachable]
+                new = set(nodes)
+                for predecessor in predecessors:
+                    new &= dominators[predecessor]
+                if not predecessors:
+                    new = set()
+                new.add(start)
+                if new != dominators[start]:
+                    dominators[start] = new
+                    changed = True
+        return dominators
+
+    def find_loops(self) -> None:
+        """
+            Function for finding natural loops and their nesting
+        """
+        dominators = self.dominators()
+        bodies: dict[int, set[int]] = {}
+        for start in self.reachable:
+            for successor in self.blocks[start].successors:
+                if successor in dominators.get(start, ()):  # back edge
+                    body = bodies.setdefault(successor, set([successor]))
+                    worklist = [start]
+                    while worklist:
+                        node = worklist.pop()
+                        if node in body:
+                            continue
+                        body.add(node)
+                        worklist.extend(self.blocks[node].predecessors)
+        self.loops = [Loop(head, body) for head, body in bodies.items()]
+        self.loops.sort(key=lambda loop: len(loop.body))
+        for i, loop in enumerate(self.loops):
+            for outer in self.loops[i + 1:]:
+                if loop.head in outer.body and loop.body <= outer.body:
+                    loop.parent = outer
+                    break
+        for loop in self.loops:
+            parent = loop.parent
+            while parent is not None:
+                loop.depth += 1
+                parent = parent.parent
+        for loop in self.loops:
+            for start in loop.body:
+                self.blocks[start].loop_depth = max(
+                    self.blocks[start].loop_depth, loop.depth)
+            exits = any(s not in loop.body for start in loop.body
+                        for s in self.blocks[start].successors)
+            stops = any(self.blocks[start].instructions[-1].opcode in [opcodes.halt, opcodes.ret]
+                        for start in loop.body)
+            if not exits and not stops:
+                self.problems.append(
+                    'Loop at {:#x} has no exit'.format(loop.head))
+        self.loop_heads = set(loop.head for loop in self.loops)
+
+    def check(self) -> None:
+        """
+            Function for rejecting obviously broken programs
+            def check(self) -> None
+
+            Raises Exception with all problems found.
+        """
+        if self.problems:
+            raise Exception('Program is broken:\n' + '\n'.join(self.problems))
+
+    def name(self, address: int) -> str:
+        """
+            Function for getting label or function name of address
+        """
+        for name, value in self.functions.items():
+            if value == address:
+                return '<{}>'.format(name)
+        for name, value in self.labels.items():
+            if value == address:
+                return '.{}'.format(name)
+        return '{:#x}'.format(address)
+
+    def report(self) -> str:
+        """
+            Function for getting text description of the graph
+        """
+        names = list(regfile.keys())
+        lines = []
+        for start in sorted(self.blocks):
+            block = self.blocks[start]
+            lines.append('{} {:#06x}-{:#06x} depth={}{} -> {}'.format(
+                self.name(start), block.start, block.end, block.loop_depth,
+                ' unreachable' if start in self.unreachable else '',
+                ', '.join(self.name(s) for s in block.successors)))
+            lines.append('    live in:  {}'.format(
+                ' '.join(names[r] for r in sorted(block.live_in))))
+            lines.append('    live out: {}'.format(
+                ' '.join(names[r] for r in sorted(block.live_out))))
+        for loop in self.loops:
+            lines.append('loop {} depth={} blocks={}'.format(
+                self.name(loop.head), loop.depth, ', '.join(self.name(s) for s in sorted(loop.body))))
+        for instruction in self.dead_stores():
+            lines.append('dead store at {:#x}'.format(instruction.address))
+        for problem in self.problems:
+            lines.append('problem: {}'.format(problem))
+        return '\n'.join(lines)
@@ -1,5 +1,4 @@
 import os
-from typing import List
 from utils import regfile, twos_components
 
 
@@ -40,6 +39,7 @@ class opcodes(enumerate):  # instruction opcodes
 variables = {}  # variables from .data
 functions_addresses = {}  # function_addresses for call instructions
 address_points = {}  # address_poinst for jump instructions
+text_sections = []  # .text sections of the last program (scan())
 
 instruction_stack = []
 
@@ -53,9 +53,10 @@ def get_number_of_bytes(instruction: int) -> int:
     return 6
 
 
-def parse_instruction(instruction: List['str']) -> int:
+def parse_instruction(instruction: list[str], verbose: bool = True) -> int:
     global opcodes
-    print(instruction)
+    if verbose:
+        print(instruction)
     op = instruction[0]  # operation
     n = len(instruction)  # len of instruction
 
@@ -86,7 +87,8 @@ def parse_instruction(instruction: List['str']) -> int:
             else:
                 rop = int(rop, 16)
             rop = twos_components(rop)
-            print(rop)
+            if verbose:
+                print(rop)
             return parsed + (lop << 8) + (rop << 16)
         elif op == 'addrr':
             parsed = opcodes.addrr
@@ -189,8 +191,7 @@ def parse_instruction(instruction: List['str']) -> int:
         elif op == 'ret':
             return opcodes.ret
     else:  # if operation is unknown
-        print('{} - unknown instruction'.format(op))
-        exit(0)
+        raise Exception('{} - unknown instruction'.format(op))
 
 
 def objdump(instruction, parsed_instruction, objdumpstr):
@@ -205,21 +206,38 @@ def objdump(instruction, parsed_instruction, objdumpstr):
     objdumpstr[0] += "{:<20} {}".format(hex_instrution, instruction) + "\n"
 
 
-def parse_variable(encoded: str) -> None:
+def parse_variable(encoded: str, verbose: bool = True) -> None:
     """
         Function for parsing variable
-        def parse_variable(encoded: str) -> None:
+        def parse_variable(encoded: str, verbose: bool = True) -> None:
         str - string of type: variable_name variable_value
     """
     var_name, var_value = encoded.split(' ')
     variables[var_name] = int(var_value, 16)
-    print(variables)
+    if verbose:
+        print(variables)
 
 
-def asm_parser(file_name: str, computer) -> None:
+def asm_parser(file_name: str, computer, verbose: bool = True) -> str:
     """
         Function for getting assember instruction, parsing them and loading into memory
-        def asm_parser(file_name: str, computer: SEQ) -> None:
+        def asm_parser(file_name: str, computer: SEQ, verbose: bool = True) -> str:
+    """
+    f = open(file_name)
+    file_size = os.path.getsize(file_name)
+    source = f.read(file_size)
+    f.close()
+    return assemble(source, computer, verbose)
+
+
+def scan(source: str, verbose: bool = True) -> tuple[list, int]:
+    """
+        Function for finding sections, address points, functions and variables of program
+        def scan(source: str, verbose: bool = True) -> tuple[list[Section], int]
+
+        First pass shared by assemble() and IncrementalAssembler.layout(), globals of
+        previous program are replaced. Every instruction takes 6 bytes.
+        Returns .text sections in source order and entry point (address of main).
     """
     global entry_point
 
@@ -227,27 +245,26 @@ def asm_parser(file_name: str, computer) -> None:
     pc_val = 0
     instruction_address = -1
 
-    f = open(file_name)
-    file_size = os.path.getsize(file_name)
+    variables.clear()
+    functions_addresses.clear()
+    address_points.clear()
+    text_sections.clear()
 
-    data = f.read(file_size).split('\n')  # get lines without \n character
-    data = list(map(lambda x: x.rstrip(' ').rstrip('\t').lstrip(' ').lstrip(
-        '\t'), data))  # delete spaces from left and from right of all lines
-
-    cur_line = 0  # current line
+    section = None
     section_type = 0  # for current file section
-
-    objdumpstr = [""]
-
-    for line in data:
+    for cur_line, line in enumerate(source.split('\n')):
+        line = line.strip(' \t')  # delete spaces from left and from right
         if not line:
             continue
         if line[0] == '.':
             line_len = len(line)
             if line_len != 5 and line_len > 1 or (line_len == 5 and line[1:5] != 'text' and line[1:5] != 'data'):
                 # getting address point for loops
-                address_points[line[1: len(line)]] = instruction_address
-                print(address_points)
+                address_points[line[1:]] = instruction_address
+                if verbose:
+                    print(address_points)
+                if section is not None:
+                    section.lines.append(line)
             elif line_len == 5:
                 if line[1:5] == 'text':
                     section_type = 2
@@ -257,58 +274,223 @@ def asm_parser(file_name: str, computer) -> None:
                 raise Exception(
                     'Irregular address {}'.format(line[1:line_len]))
         elif '<' in line and '>' in line:  # detecting function
-            if section_type == 2:  # if current section is .text
-                parsed = line.split('<')[1].split(':')
-                function_name = parsed[0]
-                function_address = int(parsed[1].split('>')[0], 16)
-                functions_addresses[function_name] = function_address
-                instruction_address = function_address
-                if function_name == "main":
-                    pc_val = function_address
-                    entry_point = cur_line
-            else:
+            if section_type != 2:
                 raise Exception(
                     'function declaration should be in .text section: {}'.format(line))
-        elif section_type == 2:
+            parsed = line.split('<')[1].split(':')
+            function_name = parsed[0]
+            function_address = int(parsed[1].split('>')[0], 16)
+            functions_addresses[function_name] = function_address
+            instruction_address = function_address
+            if function_name == "main":
+                pc_val = function_address
+                entry_point = cur_line
+            section = Section(function_name, function_address)
+            text_sections.append(section)
+        elif section_type == 1:  # if current section is .data
+            parse_variable(line, verbose)
+        elif section_type == 2:  # current line is instruction
+            if section is None:  # instructions before first function
+                section = Section(None, instruction_address)
+                text_sections.append(section)
+            section.lines.append(line)
             instruction_address += 6
+    return list(text_sections), pc_val
 
-    for line in data:
-        if not line:    # line is empty
-            cur_line += 1
-            continue
-        if line[0] == '.':  # line begins with .
-            line_len = len(line)  # len of the line
-            if line_len == 5:  # checking for len (to not get out of range)
-                if line[1:5] == 'text':  # line is .text
-                    section_type = 2    # set section type to 2
-                elif line[1:5] == 'data':  # line is .data
-                    section_type = 1    # set section type to 1
-            cur_line += 1
-            continue
-        if section_type == 1:  # if current section is .data
-            parse_variable(line)  # parsing variable
-        elif '<' in line and '>' in line:  # detecting function
-            if section_type == 2:  # if current section is .text
-                parsed = line.split('<')[1].split(':')
-                function_name = parsed[0]
-                function_address = int(parsed[1].split('>')[0], 16)
-                functions_addresses[function_name] = function_address
-                instruction_address = function_address
-                if function_name == "main":
-                    pc_val = function_address
-                    entry_point = cur_line
-        elif section_type == 2:
-            # Current line is instruction
+
+def assemble(source: str, computer, verbose: bool = True) -> str:
+    """
+        Function for parsing assembler source text and loading it into memory
+        def assemble(source: str, computer: SEQ, verbose: bool = True) -> str:
+
+        Labels, functions and variables of previous program are forgotten.
+        Returns objdump of the program, it is printed only when verbose is set.
+    """
+    sections, pc_val = scan(source, verbose)
+    objdumpstr = [""]
+    for section in sections:
+        instruction_address = section.start
+        for line in section.lines:
+            if line[0] == '.':  # address point
+                continue
             splited_line = line.split(' ')  # split line
             # getting int instruction value
-            instruction = parse_instruction(splited_line)
+            instruction = parse_instruction(splited_line, verbose)
+            if instruction is None:
+                raise Exception('{} - unknown instruction'.format(line))
             num_of_bytes = get_number_of_bytes(instruction)
             computer.writeMem(instruction_address,
                               instruction.to_bytes(num_of_bytes, 'little'))  # writting instruction into memory
-            # increasing instruction_address by 4 to get instruction address for next instruction
+            # increasing instruction_address by 6 to get instruction address for next instruction
             instruction_address += 6
             objdump(line, instruction, objdumpstr)
-        cur_line += 1
     computer.set_pc(pc_val)  # setting init program counter value
 
-    print(objdumpstr[0])
+    if verbose:
+        print(objdumpstr[0])
+    return objdumpstr[0]
+
+
+class Section(object):
+    """
+        Part of .text starting with function declaration <name:address>
+    """
+
+    def __init__(self, name: str | None, start: int) -> None:
+        self.name: str | None = name
+        self.start: int = start
+        self.lines: list[str] = []  # instructions and address points of the section
+
+    def text(self) -> str:
+        return '\n'.join(self.lines)
+
+    def addresses(self) -> list[int]:
+        """
+            Function for getting addresses of instructions of the section
+        """
+        count = len([line for line in self.lines if line[0] != '.'])
+        return [self.start + 6*i for i in range(count)]
+
+    def symbols(self) -> set[str]:
+        """
+            Function for getting names the section refers to (address points, variables)
+        """
+        names = set()
+        for line in self.lines:
+            if line[0] != '.':
+                for operand in line.split(' ')[1:]:
+                    names.add(operand.split(',')[0])
+        return names
+
+
+class IncrementalAssembler(object):
+    """
+        Assembler which keeps encoded sections between calls.
+
+        Encoded bytes of every section are cached by hash of its text together with
+        values of address points and variables it uses, so after an edit only changed
+        sections (and sections whose jump targets or variables moved) are encoded
+        again. load() patches only byte ranges which differ from the previous load.
+        Only sections of the last assembled program are kept in the cache.
+    """
+
+    def __init__(self, verbose: bool = False) -> None:
+        self.verbose: bool = verbose
+        self.cache: dict[tuple, bytes] = {}         # section key -> encoded bytes
+        self.image: dict[str | None, tuple] = {}    # section name -> (start, bytes) loaded
+        self.loaded: bool = False                   # image is in memory of computer
+        self.pc: int = 0                            # entry point of last program
+        self.encoded: int = 0   # sections encoded by last call
+        self.reused: int = 0    # sections taken from cache by last call
+
+    def layout(self, source: str) -> list[Section]:
+        """
+            Function for finding sections, address points, functions and variables
+            def layout(self, source: str) -> list[Section]
+
+            Fills asm_parser globals the same way assemble() does (scan()).
+        """
+        sections, self.pc = scan(source, self.verbose)
+        return sections
+
+    def key(self, section: Section) -> tuple:
+        """
+            Function for getting cache key of section
+        """
+        used = []
+        for name in sorted(section.symbols()):
+            if name in address_points:
+                used.append(('.', name, address_points[name]))
+            if name in variables:
+                used.append(('var', name, variables[name]))
+        import hashlib
+        digest = hashlib.sha1(section.text().encode()).hexdigest()
+        return (digest, tuple(used))
+
+    def encode(self, section: Section) -> bytes:
+        """
+            Function for encoding section, every instruction takes 6 bytes
+        """
+        encoded = bytearray()
+        for line in section.lines:
+            if line[0] == '.':
+                continue
+            instruction = parse_instruction(line.split(' '), self.verbose)
+            if instruction is None:
+                raise Exception('{} - unknown instruction'.format(line))
+            num_of_bytes = get_number_of_bytes(instruction)
+            encoded += instruction.to_bytes(num_of_bytes, 'little')
+            encoded += bytes(6 - num_of_bytes)
+        return bytes(encoded)
+
+    def assemble(self, source: str) -> list[tuple[str | None, int, bytes]]:
+        """
+            Function for getting encoded sections of program
+            def assemble(self, source: str) -> list[tuple[str | None, int, bytes]]
+
+            Returns (section name, start address, bytes) in source order.
+        """
+        self.encoded = 0
+        self.reused = 0
+        result = []
+        cache = {}
+        for section in self.layout(source):
+            key = self.key(section)
+            encoded = self.cache.get(key)
+            if encoded is None:
+                encoded = self.encode(section)
+                self.encoded += 1
+            else:
+                self.reused += 1
+            cache[key] = encoded
+            result.append((section.name, section.start, encoded))
+        self.cache = cache  # sections of edited out versions are dropped
+        return result
+
+    def seed(self, source: str) -> None:
+        """
+            Function for taking program already loaded by asm_parser.assemble() as the previous load
+            def seed(self, source: str) -> None
+        """
+        self.image = {name: (start, encoded)
+                      for name, start, encoded in self.assemble(source)}
+        self.loaded = True
+
+    def load(self, source: str, computer, set_pc: bool = False) -> list[tuple[int, int]]:
+        """
+            Function for loading program into memory of computer
+            def load(self, source: str, computer: SEQ, set_pc: bool = False) -> list[tuple[int, int]]
+
+            Only bytes which differ from previously loaded program are written, code of
+            removed or shrunk sections is zeroed. Registers and program counter of a
+            running computer are kept unless set_pc is given (always set on first load).
+            Returns written (start, end) address ranges.
+        """
+        first = not self.loaded
+        sections = self.assemble(source)
+        old = {}  # address -> byte of previous program
+        for start, encoded in self.image.values():
+            for i, byte in enumerate(encoded):
+                old[start + i] = byte
+        new = dict.fromkeys(old, 0)
+        for name, start, encoded in sections:
+            for i, byte in enumerate(encoded):
+                new[start + i] = byte
+
+        ranges = []
+        for address in sorted(new):
+            if not first and old.get(address) == new[address]:
+                continue
+            if ranges and ranges[-1][1] == address:
+                ranges[-1][1] = address + 1
+            else:
+                ranges.append([address, address + 1])
+        for start, end in ranges:
+            computer.writeMem(start, bytes(new[a] for a in range(start, end)))
+
+        self.image = {name: (start, encoded)
+                      for name, start, encoded in sections}
+        self.loaded = True
+        if first or set_pc:
+            computer.set_pc(self.pc)
+        return [(start, end) for start, end in ranges]
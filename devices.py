@@ -0,0 +1,199 @@
+class Device(object):
+    """
+        Memory mapped device, attached to SEQ with SEQ.add_device(address, device).
+
+        Device registers occupy size bytes starting at the address. Reads and writes
+        inside the range are sent to read()/write() with offset from the address, side
+        effects may be delayed until flush() (SEQ calls it when computing stops).
+        Accesses crossing boundary of the range raise Exception.
+    """
+    size = 16
+
+    def attach(self, computer) -> None:
+        """
+            Function called when device is added to computer
+            def attach(self, computer: SEQ) -> None
+        """
+        self.computer = computer
+
+    def read(self, offset: int, num_of_bytes: int) -> int:
+        return 0
+
+    def write(self, offset: int, data: bytes) -> None:
+        pass
+
+    def flush(self) -> None:
+        pass
+
+
+class Console(Device):
+    """
+        Character console
+
+        Registers:
+            0x0 - write: output low byte, read: next input byte (0xffffffff if none)
+            0x4 - write: flush output, read: number of buffered output bytes
+
+        Output is collected in a buffer and written to stream by buffer_size chunks
+        (and on flush), so printing a string costs one host write instead of one per byte.
+        stream - binary stream, sys.stdout.buffer by default
+    """
+    size = 8
+
+    def __init__(self, stream=None, input: bytes = b'', buffer_size: int = 4096) -> None:
+        if stream is None:
+            import sys
+            sys.stdout.flush()  # keep order with text printed before
+            stream = sys.stdout.buffer
+        self.stream = stream
+        self.input: bytes = input
+        self.input_position: int = 0
+        self.buffer: bytearray = bytearray()
+        self.buffer_size: int = buffer_size
+
+    def read(self, offset: int, num_of_bytes: int) -> int:
+        if offset == 0:
+            if self.input_position >= len(self.input):
+                return 0xffffffff
+            self.input_position += 1
+            return self.input[self.input_position - 1]
+        if offset == 4:
+            return len(self.buffer)
+        return 0
+
+    def write(self, offset: int, data: bytes) -> None:
+        if offset == 0:
+            self.buffer.append(data[0])
+            if len(self.buffer) >= self.buffer_size:
+                self.flush()
+        elif offset == 4:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self.buffer:
+            return
+        self.stream.write(bytes(self.buffer))
+        self.stream.flush()
+        self.buffer.clear()
+
+
+class Timer(Device):
+    """
+        Free running timer
+
+        Registers:
+            0x0 - read: low 32 bits of the counter
+            0x4 - read: high 32 bits of the counter (latched by reading 0x0)
+            0x8 - write: reset counter to zero
+
+        clock - function returning counter value, host microseconds by default
+                (lambda: computer.cycles gives a deterministic cycle counter).
+    """
+    size = 12
+
+    def __init__(self, clock=None) -> None:
+        if clock is None:
+            import time
+
+            def clock():
+                return time.monotonic_ns() // 1000
+        self.clock = clock
+        self.base: int = clock()
+        self.latched: int = 0
+
+    def read(self, offset: int, num_of_bytes: int) -> int:
+        if offset == 0:
+            self.latched = self.clock() - self.base
+            return self.latched & 0xffffffff
+        if offset == 4:
+            return self.latched >> 32 & 0xffffffff
+        return 0
+
+    def write(self, offset: int, data: bytes) -> None:
+        if offset == 8:
+            self.base = self.clock()
+
+
+class BlockDevice(Device):
+    """
+        Block device backed by a host file
+
+        Registers:
+            0x0 - block number
+            0x4 - guest memory address of the transfer
+            0x8 - write: command, 1 - read block into memory, 2 - write memory into block
+            0xC - read: number of blocks
+
+        Every command transfers a whole page of page_size bytes with one slice copy.
+        Written pages are kept in memory and stored into the file on flush().
+    """
+    size = 16
+
+    def __init__(self, file_name: str, page_size: int = 256, blocks: int | None = None) -> None:
+        import os
+        self.file_name: str = file_name
+        self.page_size: int = page_size
+        if not os.path.exists(file_name):
+            open(file_name, 'wb').close()
+        if blocks is None:
+            blocks = max(1, -(-os.path.getsize(file_name) // page_size))
+        self.blocks: int = blocks
+        self.block: int = 0
+        self.address: int = 0
+        self.pages: dict[int, bytes] = {}   # block number -> page read or written
+        self.dirty: set[int] = set()        # pages not stored into the file yet
+
+    def read(self, offset: int, num_of_bytes: int) -> int:
+        if offset == 0:
+            return self.block
+        if offset == 4:
+            return self.address
+        if offset == 12:
+            return self.blocks
+        return 0
+
+    def write(self, offset: int, data: bytes) -> None:
+        value = int.from_bytes(data, 'little')
+        if offset == 0:
+            self.block = value
+        elif offset == 4:
+            self.address = value
+        elif offset == 8:
+            if not 0 <= self.block < self.blocks:
+                raise Exception('Block {} out of device {} ({} blocks)'.format(
+                    self.block, self.file_name, self.blocks))
+            end = self.address + self.page_size
+            if end > self.computer.memsize:
+                raise Exception('Block transfer out of memory: {:#x}'.format(
+                    self.address))
+            if value == 1:
+                self.computer.memory[self.address:end] = self.page(self.block)
+                self.computer.invalidate(self.address, end)
+            elif value == 2:
+                self.pages[self.block] = bytes(
+                    self.computer.memory[self.address:end])
+                self.dirty.add(self.block)
+            else:
+                raise Exception('Unknown block device command: {}'.format(value))
+
+    def page(self, block: int) -> bytes:
+        """
+            Function for getting content of block (from written pages or file)
+        """
+        page = self.pages.get(block)
+        if page is None:
+            with open(self.file_name, 'rb') as f:
+                f.seek(block*self.page_size)
+                page = f.read(self.page_size)
+            page = page + bytes(self.page_size - len(page))
+            self.pages[block] = page
+        return page
+
+    def flush(self) -> None:
+        if not self.dirty:
+            return
+        with open(self.file_name, 'r+b') as f:
+            for block in sorted(self.dirty):
+                f.seek(block*self.page_size)
+                f.write(self.pages[block])
+        self.dirty.clear()
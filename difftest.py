@@ -0,0 +1,341 @@
+import argparse
+import random
+from asm_parser import assemble
+from engine import FastEngine
+from seq import SEQ, opcode_names
+from utils import regfile
+
+register_names = list(regfile.keys())
+
+# Engines which can be stopped after any instruction and compared in lockstep
+# ('hot' compiles loops into superblocks after two iterations, they run only when
+# checkpoint leaves budget for a whole iteration)
+STEPPING_ENGINES = ['fast', 'fused', 'hot']
+ENGINES = STEPPING_ENGINES + ['pipeline']
+
+
+def disassemble(computer: SEQ, address: int) -> str:
+    """
+        Function for getting text of decoded instruction at address
+    """
+    opcode, loper, roper, new_PC = computer.decode_instruction(address)
+    return '{:#06x}: {} {}, {}'.format(address, opcode_names.get(opcode, hex(opcode)), loper, roper)
+
+
+def architectural_state(computer: SEQ) -> dict:
+    """
+        Function for getting registers, flags, memory and program counter of computer
+    """
+    flags = computer.status_flags
+    return {
+        'registers': [computer.readReg(i) for i in range(16)],
+        'flags': {name: flags[name] for name in ['ZF', 'SF', 'OF', 'CF']},
+        'memory': bytes(computer.memory),
+        'PC': computer.PC,
+    }
+
+
+def state_difference(expected: dict, actual: dict, compare_pc: bool = True) -> tuple | None:
+    """
+        Function for finding first difference of two architectural states
+        def state_difference(expected: dict, actual: dict, compare_pc: bool = True) -> tuple | None
+
+        Returns (field, expected value, actual value) or None.
+    """
+    for i in range(16):
+        if expected['registers'][i] != actual['registers'][i]:
+            return (register_names[i], hex(expected['registers'][i]), hex(actual['registers'][i]))
+    for name in ['ZF', 'SF', 'OF', 'CF']:
+        if expected['flags'][name] != actual['flags'][name]:
+            return (name, expected['flags'][name], actual['flags'][name])
+    if expected['memory'] != actual['memory']:
+        for addr in range(len(expected['memory'])):
+            if expected['memory'][addr] != actual['memory'][addr]:
+                return ('memory[{:#x}]'.format(addr), hex(expected['memory'][addr]), hex(actual['memory'][addr]))
+    if compare_pc and expected['PC'] != actual['PC']:
+        return ('PC', expected['PC'], actual['PC'])
+    return None
+
+
+class Divergence(object):
+    """
+        First difference between reference engine and another engine
+    """
+
+    def __init__(self, engine: str, instructions: int, field: str, expected, actual, context: list[str]) -> None:
+        self.engine: str = engine
+        self.instructions: int = instructions  # instructions retired by reference engine
+        self.field: str = field
+        self.expected = expected
+        self.actual = actual
+        self.context: list[str] = context     # last instructions of reference engine
+
+    def __str__(self) -> str:
+        lines = ['{} diverges after {} instructions: {} expected {} got {}'.format(
+            self.engine, self.instructions, self.field, self.expected, self.actual)]
+        lines.extend('    ' + line for line in self.context)
+        return '\n'.join(lines)
+
+
+class Run(object):
+    """
+        Program loaded into a new computer and executed by one engine
+    """
+
+    def __init__(self, engine: str, source: str, memory: int, stack_pointer: int) -> None:
+        self.engine: str = engine
+        self.computer: SEQ = SEQ(32, memory)
+        self.computer.delay = 0
+        self.computer.trace = False
+        assemble(source, self.computer, verbose=False)
+        self.computer.set_stack_pointer(stack_pointer)
+        self.fast: FastEngine | None = None
+        if engine in STEPPING_ENGINES:
+            self.fast = FastEngine(self.computer, fuse=engine != 'fast',
+                                   hot_threshold=2 if engine == 'hot' else None)
+        self.error: str | None = None
+
+    @property
+    def halted(self) -> bool:
+        if self.fast is not None:
+            return self.fast.halted
+        return self.computer.halted
+
+    def step(self, instructions: int) -> None:
+        """
+            Function for running engine for number of instructions (stepping engines only)
+        """
+        try:
+            self.fast.run(instructions)
+        except Exception as error:
+            self.error = '{}: {}'.format(type(error).__name__, error)
+
+    def finish(self, max_instructions: int) -> None:
+        """
+            Function for running engine until halt or max_instructions
+        """
+        try:
+            if self.fast is not None:
+                self.fast.run(max_instructions - self.fast.instructions)
+            else:
+                self.computer.compute(max_instructions=max_instructions)
+        except Exception as error:
+            self.error = '{}: {}'.format(type(error).__name__, error)
+
+
+def compare(source: str, engines: list[str] | None = None, checkpoint: int = 1, memory: int = 1024, stack_pointer: int = 0x200, max_instructions: int = 10000, context: int = 8) -> Divergence | None:
+    """
+        Function for running program on several engines and finding first divergence
+        def compare(source: str, engines: list[str] | None = None, checkpoint: int = 1, ...) -> Divergence | None
+
+        The first engine is the reference. Stepping engines are compared with it every
+        checkpoint instructions; the pipeline retires instructions while later ones are
+        already in flight, so it is compared only after halt (program counter excluded,
+        fetch runs ahead of halt).
+    """
+    if engines is None:
+        engines = ENGINES
+    if engines[0] not in STEPPING_ENGINES:
+        raise Exception('Reference engine must be one of {}'.format(
+            STEPPING_ENGINES))
+    runs = [Run(engine, source, memory, stack_pointer) for engine in engines]
+    reference = runs[0]
+    stepping = [run for run in runs[1:] if run.engine in STEPPING_ENGINES]
+    history = []
+
+    def divergence(run, field, expected, actual):
+        return Divergence(run.engine, reference.fast.instructions, field, expected, actual, history[-context:])
+
+    while not reference.halted and reference.fast.instructions < max_instructions:
+        history.append(disassemble(reference.computer, reference.computer.PC))
+        reference.step(checkpoint)
+        expected = architectural_state(reference.computer)
+        for run in stepping:
+            run.step(checkpoint)
+            if run.error is not None or reference.error is not None:
+                if run.error != reference.error:
+                    return divergence(run, 'error', reference.error, run.error)
+                continue
+            difference = state_difference(
+                expected, architectural_state(run.computer))
+            if difference is None and run.halted != reference.halted:
+                difference = ('halted', reference.halted, run.halted)
+            if difference is not None:
+                return divergence(run, *difference)
+        if reference.error is not None:
+            break
+
+    expected = architectural_state(reference.computer)
+    for run in runs[1:]:
+        if run.engine in STEPPING_ENGINES:
+            continue
+        run.finish(max_instructions)
+        if run.error != reference.error:
+            return divergence(run, 'error', reference.error, run.error)
+        if run.halted != reference.halted:
+            return divergence(run, 'halted', reference.halted, run.halted)
+        difference = state_difference(
+            expected, architectural_state(run.computer), compare_pc=False)
+        if difference is not None:
+            return divergence(run, *difference)
+    return None
+
+
+def random_program(rng: random.Random, length: int = 20, functions: int = 2, calls: bool = True, stack: bool = True, full: bool = False) -> str:
+    """
+        Function for generating random well formed program
+        def random_program(rng: random.Random, length: int = 20, functions: int = 2, ..., full: bool = False) -> str
+
+        Only instruction forms the assembler encodes and the engines decode consistently
+        are generated: movri, movrr, movmr, addri, subri, push/pop (balanced), forward
+        jp/jcc, counted loops, call of leaf functions and halt. Every program halts.
+        Code of main starts at 0x0, functions at 0x100, data is written at 0x300.
+
+        full - also movrm, addrm, subrm, addmr, submr and forward jcc inside loop
+               bodies (forms the pipeline does not execute like stepping engines).
+               passop is never generated: it is 1 byte long in a 6 byte slot and the
+               engines run on through the padding.
+    """
+    registers = ['eax', 'ebx', 'edx', 'esi', 'edi', 'ebp']  # ecx is the loop counter
+    jumps = ['jnz', 'jne', 'je', 'jge', 'jle', 'jg', 'jl']
+    labels = [0]
+
+    def immediate():
+        if rng.random() < 0.2:
+            return hex(rng.choice([0, 1, 0x7fffffff, -0x80000000, -1]))
+        return hex(rng.randrange(0, 16))
+
+    def data():
+        return hex(0x300 + 4*rng.randrange(0, 32))
+
+    def simple(lines, allow_stack):
+        if full and rng.random() < 0.3:
+            memory(lines)
+            return
+        kind = rng.random()
+        reg = rng.choice(registers)
+        if kind < 0.25:
+            lines.append('movri {}, {}'.format(reg, immediate()))
+        elif kind < 0.45:
+            lines.append('addri {}, {}'.format(reg, immediate()))
+        elif kind < 0.65:
+            lines.append('subri {}, {}'.format(reg, immediate()))
+        elif kind < 0.75:
+            lines.append('movrr {}, {}'.format(reg, rng.choice(registers)))
+        elif kind < 0.85:
+            lines.append('movmr {}, {}'.format(data(), reg))
+        elif allow_stack:
+            other = rng.choice(registers)
+            lines.append('push {}'.format(reg))
+            lines.append('addri {}, {}'.format(reg, immediate()))
+            lines.append('pop {}'.format(other))
+        else:
+            lines.append('addri {}, {}'.format(reg, immediate()))
+
+    def memory(lines):
+        kind = rng.random()
+        reg = rng.choice(registers)
+        if kind < 0.5:
+            lines.append('{} {}, {}'.format(
+                rng.choice(['movrm', 'addrm', 'subrm']), reg, data()))
+        else:
+            lines.append('{} {}, {}'.format(
+                rng.choice(['addmr', 'submr']), data(), reg))
+
+    def label():
+        labels[0] += 1
+        return 'L{}'.format(labels[0])
+
+    lines = ['.text', '<main:0x0000>']
+    for reg in registers:
+        lines.append('movri {}, {}'.format(reg, immediate()))
+    while len(lines) < length:
+        kind = rng.random()
+        if kind < 0.6:
+            simple(lines, stack)
+        elif kind < 0.75:
+            name = label()
+            lines.append('movri ecx, {}'.format(hex(rng.randrange(1, 5))))
+            lines.append('.' + name)
+            for _ in range(rng.randrange(1, 4)):
+                simple(lines, stack)
+            if full and rng.random() < 0.5:
+                skip = label()
+                lines.append('{} {}'.format(rng.choice(jumps), skip))
+                simple(lines, stack)
+                lines.append('.' + skip)
+            lines.append('subri ecx, 0x1')
+            lines.append('jg {}'.format(name))
+        elif kind < 0.9:
+            name = label()
+            lines.append(rng.choice(['addri', 'subri']) + ' {}, {}'.format(
+                rng.choice(registers), immediate()))
+            lines.append('{} {}'.format(rng.choice(jumps + ['jp']), name))
+            for _ in range(rng.randrange(1, 3)):
+                simple(lines, stack)
+            lines.append('.' + name)
+        elif calls and functions:
+            lines.append('call {}'.format(
+                hex(0x100 + 0x20*rng.randrange(0, functions))))
+    lines.append('halt')
+    for n in range(functions):
+        lines.append('<f{}:{}>'.format(n, hex(0x100 + 0x20*n)))
+        for _ in range(rng.randrange(1, 4)):
+            simple(lines, False)
+        lines.append('ret')
+    return '\n'.join(lines) + '\n'
+
+
+def fuzz(count: int, seed: int = 0, engines: list[str] | None = None, **generator) -> list[tuple[int, str, Divergence]]:
+    """
+        Function for comparing engines on count random programs
+        def fuzz(count: int, seed: int = 0, engines: list[str] | None = None, **generator) -> list
+
+        Returns (program seed, source, divergence) for every diverging program.
+        Without 'pipeline' engine programs use the full instruction set by default.
+    """
+    if engines is None:
+        engines = ENGINES
+    generator.setdefault('full', 'pipeline' not in engines)
+    found = []
+    for n in range(seed, seed + count):
+        source = random_program(random.Random(n), **generator)
+        result = compare(source, engines)
+        if result is not None:
+            found.append((n, source, result))
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Differential testing of SEQ engines')
+    parser.add_argument('program', nargs='?',
+                        help='.asm file (random programs if omitted)')
+    parser.add_argument('--engines', default=','.join(ENGINES),
+                        help='comma separated engines, first one is the reference')
+    parser.add_argument('--count', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--checkpoint', type=int, default=1)
+    parser.add_argument('--no-calls', action='store_true')
+    parser.add_argument('--no-stack', action='store_true')
+    args = parser.parse_args()
+    engines = args.engines.split(',')
+
+    if args.program:
+        with open(args.program) as f:
+            result = compare(f.read(), engines, args.checkpoint)
+        print(result if result is not None else 'No divergence')
+        return
+
+    found = fuzz(args.count, args.seed, engines,
+                 calls=not args.no_calls, stack=not args.no_stack)
+    print('{} of {} programs diverge'.format(len(found), args.count))
+    if found:
+        n, source, result = found[0]
+        print('seed {}:'.format(n))
+        print(result)
+        print(source)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,577 @@
+from seq import ESP, HOT_THRESHOLD, SEQ, jump_conditions, opcodes
+from utils import twos_components
+
+MASK = (1 << 32) - 1  # 32 bit register mask
+MAX_TRACE = 64  # instructions in one superblock
+
+# Conditions of conditional jumps as python expressions over signed ALU result
+condition_expressions = {
+    opcodes.jnz: 'res != 0',
+    opcodes.jne: 'res != 0',
+    opcodes.je: 'res == 0',
+    opcodes.jge: 'res >= 0',
+    opcodes.jle: 'res <= 0',
+    opcodes.jg: 'res > 0',
+    opcodes.jl: 'res < 0',
+}
+
+alu_operations = [opcodes.addrr, opcodes.addmr, opcodes.addrm, opcodes.addri,
+                  opcodes.subrr, opcodes.submr, opcodes.subrm, opcodes.subri]
+
+
+def condition_holds(opcode: int, result: int) -> bool:
+    """
+        Function for checking conditional jump against the last ALU result
+        def condition_holds(opcode: int, result: int) -> bool
+
+        ZF and SF are taken from the result the same way utils.alu_flags derives them.
+    """
+    zf = result == 0
+    sf = result < 0
+    if opcode == opcodes.jnz or opcode == opcodes.jne:
+        return not zf
+    elif opcode == opcodes.je:
+        return zf
+    elif opcode == opcodes.jge:
+        return not sf or zf
+    elif opcode == opcodes.jle:
+        return sf or zf
+    elif opcode == opcodes.jg:
+        return not sf and not zf
+    elif opcode == opcodes.jl:
+        return sf and not zf
+    return False
+
+
+class FastEngine(object):
+    """
+        Functional (not pipelined) engine over SEQ state.
+
+        Instructions are decoded once into (handler, args, count) entries keyed by address
+        and executed one entry per dispatch. With fuse enabled a peephole pass replaces
+        common instruction pairs with one superinstruction entry:
+            addri/subri + jcc       - compare and branch
+            push + call             - save register and call
+            pop + call, pop + ret   - restore register and call/return
+            movri + ALU op          - load immediate and operate on the same register
+        Architectural results are the same with and without fusion.
+
+        Taken backward jumps are counted per target. When a loop head reaches
+        hot_threshold, one iteration is recorded while it executes and compiled into
+        a superblock: a python function running the iteration as straight line code
+        with guards on conditional jumps. A failed guard leaves the superblock at the
+        jump (side exit) and the interpreter continues from there.
+    """
+
+    def __init__(self, computer: SEQ, fuse: bool = True, hot_threshold: int | None = HOT_THRESHOLD) -> None:
+        self.computer: SEQ = computer
+        self.fuse: bool = fuse
+        # 0 or None disables superblocks
+        self.hot_threshold: int | None = hot_threshold or None
+        self.program: dict[int, tuple] = {}  # address -> decoded (maybe fused) entry
+        self.plain: dict[int, tuple] = {}    # address -> decoded single instruction
+
+        self.regs: list[int] = [0]*16  # register values while running
+        self.alu_state: tuple = computer.alu_state
+
+        self.dispatches = 0     # number of executed entries
+        self.instructions = 0   # number of executed instructions
+        self.halted = False
+        self.at_breakpoint = None  # breakpoint address last run() stopped at
+
+        self.back_edges: dict[int, int] = {}    # loop head -> taken back edges
+        self.superblocks: dict[int, object] = {}  # loop head -> compiled iteration
+        self.superblock_ranges: dict[int, tuple] = {}  # loop head -> (first, last) address
+        self.superblock_sources: dict[int, str] = {}  # loop head -> python source
+        self.cold: set[int] = set()             # loop heads which can't be traced
+        self.superblock_instructions = 0        # instructions executed in superblocks
+        computer.add_engine(self)
+
+        self.handlers = {
+            opcodes.movrr: self.movrr,
+            opcodes.movrm: self.movrm,
+            opcodes.movmr: self.movmr,
+            opcodes.movri: self.movri,
+            opcodes.addrr: self.alu_rr,
+            opcodes.subrr: self.alu_rr,
+            opcodes.addri: self.alu_ri,
+            opcodes.subri: self.alu_ri,
+            opcodes.addrm: self.alu_rm,
+            opcodes.subrm: self.alu_rm,
+            opcodes.addmr: self.alu_mr,
+            opcodes.submr: self.alu_mr,
+            opcodes.call: self.call,
+            opcodes.jp: self.jp,
+            opcodes.push: self.push,
+            opcodes.pop: self.pop,
+            opcodes.ret: self.ret,
+            opcodes.halt: self.halt,
+            opcodes.passop: self.passop,
+        }
+        for opcode in jump_conditions:
+            self.handlers[opcode] = self.jcc
+
+    def invalidate(self, start: int | None = None, end: int | None = None) -> None:
+        """
+            Function for dropping decoded instructions (after program memory was rewritten)
+            def invalidate(self, start: int | None = None, end: int | None = None) -> None
+
+            Without arguments everything is dropped, otherwise only entries which may
+            cover bytes [start, end) (superinstruction spans two 6 bytes slots).
+        """
+        self.back_edges.clear()
+        self.cold.clear()
+        if start is None:
+            self.program.clear()
+            self.plain.clear()
+            self.superblocks.clear()
+            self.superblock_ranges.clear()
+            return
+        for cache in (self.program, self.plain):
+            for address in [a for a in cache if start - 12 < a < end]:
+                del cache[address]
+        for head, (first, last) in list(self.superblock_ranges.items()):
+            if first - 6 < end and start < last + 6:
+                del self.superblocks[head]
+                del self.superblock_ranges[head]
+
+    def predecode(self, graph) -> None:
+        """
+            Function for decoding whole program ahead of running it
+            def predecode(self, graph: analysis.ControlFlowGraph) -> None
+        """
+        for address in sorted(graph.instructions):
+            self.fused(address)
+
+    def decode(self, address: int) -> tuple:
+        """
+            Function for decoding single instruction into engine entry
+            def decode(self, address: int) -> tuple
+
+            Entry is (handler, args, count), handler(*args) returns next program counter
+            or None for halt.
+        """
+        entry = self.plain.get(address)
+        if entry is None:
+            opcode, loper, roper, new_PC = self.computer.decode_instruction(
+                address)
+            handler = self.handlers.get(opcode, self.passop)
+            entry = (handler, (opcode, loper, roper, new_PC), 1)
+            self.plain[address] = entry
+        return entry
+
+    def fused(self, address: int) -> tuple:
+        """
+            Function for decoding instruction at address with peephole fusion
+            def fused(self, address: int) -> tuple
+        """
+        first = self.decode(address)
+        entry = first
+        if self.fuse:
+            op1, a1, b1, next1 = first[1]
+            # past the end of memory decode reads zero bytes (movrr), nothing to fuse
+            op2, a2, b2, next2 = self.decode(next1)[1]
+            if op1 in [opcodes.addri, opcodes.subri] and op2 in jump_conditions:
+                entry = (self.alu_ri_jcc, (op1, a1, b1, op2, a2, next2), 2)
+            elif op1 == opcodes.push and op2 == opcodes.call:
+                entry = (self.push_call, (a1, a2, next2), 2)
+            elif op1 == opcodes.pop and op2 == opcodes.call:
+                entry = (self.pop_call, (a1, a2, next2), 2)
+            elif op1 == opcodes.pop and op2 == opcodes.ret:
+                entry = (self.pop_ret, (a1,), 2)
+            elif op1 == opcodes.movri and op2 in [opcodes.addri, opcodes.subri] and a2 == a1:
+                entry = (self.movri_alu_ri, (a1, b1, op2, b2, next2), 2)
+            elif op1 == opcodes.movri and op2 in [opcodes.addrr, opcodes.subrr] and a2 == a1:
+                entry = (self.movri_alu_rr, (a1, b1, op2, b2, next2), 2)
+        self.program[address] = entry
+        return entry
+
+    def load_state(self) -> None:
+        """
+            Function for copying registers from SEQ into the engine
+        """
+        readReg = self.computer.readReg
+        self.regs = [readReg(i) for i in range(16)]
+        self.alu_state = self.computer.alu_state
+
+    def store_state(self, pc: int) -> None:
+        """
+            Function for copying engine registers, flags and program counter back into SEQ
+        """
+        writeReg = self.computer.writeReg
+        for i in range(16):
+            writeReg(i, self.regs[i].to_bytes(4, 'little'))
+        self.computer.alu_state = self.alu_state
+        self.computer.set_pc(pc)
+
+    def run(self, max_instructions: int | None = None, breakpoints: set[int] | None = None) -> str:
+        """
+            Function for executing program from SEQ program counter
+            def run(self, max_instructions: int | None = None, breakpoints: set[int] | None = None) -> str
+
+            Returns 'halted' after halt, 'max_instructions' when budget is spent or
+            'breakpoint' when program counter reaches one of breakpoints (instruction at
+            breakpoint is not executed, run() called again continues from it).
+            A stopped run can be continued with another run() call.
+        """
+        if self.halted:
+            return 'halted'
+        program = self.program
+        pc = self.computer.PC
+        executed = 0
+        status = 'halted'
+        resume_from = self.at_breakpoint  # breakpoint to step over when resuming
+        self.at_breakpoint = None
+        if breakpoints:
+            program = self.plain  # superinstructions could jump over a breakpoint
+        hot = self.hot_threshold is not None and not breakpoints
+        self.load_state()
+        try:
+            while True:
+                if max_instructions is not None:
+                    left = max_instructions - executed
+                    if left <= 0:
+                        status = 'max_instructions'
+                        break
+                if breakpoints and pc in breakpoints and (executed or pc != resume_from):
+                    status = 'breakpoint'
+                    self.at_breakpoint = pc
+                    break
+                entry = program.get(pc)
+                if entry is None:
+                    entry = self.decode(pc) if breakpoints else self.fused(pc)
+                if max_instructions is not None and entry[2] > left:
+                    entry = self.plain[pc]  # not enough budget for superinstruction
+                handler, args, count = entry
+                next_pc = handler(*args)
+                executed += count
+                self.dispatches += 1
+                if next_pc is None:
+                    pc = args[3]
+                    self.halted = True
+                    break
+                if hot and next_pc <= pc:  # taken back edge
+                    budget = None
+                    if max_instructions is not None:
+                        budget = max_instructions - executed
+                    next_pc, count = self.hot_loop(next_pc, budget)
+                    executed += count
+                pc = next_pc
+        finally:
+            self.instructions += executed
+            self.store_state(pc)
+            if self.computer.devices:
+                self.computer.flush_devices()
+        return status
+
+    # Superblocks
+
+    def hot_loop(self, head: int, budget: int | None) -> tuple[int, int]:
+        """
+            Function for counting back edge to head and running its superblock
+            def hot_loop(self, head: int, budget: int | None) -> tuple[int, int]
+
+            Returns program counter to continue from and number of executed instructions.
+        """
+        block = self.superblocks.get(head)
+        executed = 0
+        if block is None:
+            if head in self.cold:
+                return head, 0
+            count = self.back_edges.get(head, 0) + 1
+            self.back_edges[head] = count
+            if count < self.hot_threshold:
+                return head, 0
+            pc, executed, trace = self.record_loop(head, budget)
+            if trace is None:
+                return pc, executed
+            block = self.compile_superblock(head, trace)
+            if budget is not None:
+                budget -= executed
+        pc, count = block(self.regs, budget)
+        self.dispatches += 1
+        self.superblock_instructions += count
+        return pc, executed + count
+
+    def record_loop(self, head: int, budget: int | None) -> tuple[int, int, list | None]:
+        """
+            Function for executing one iteration of loop at head and recording its path
+            def record_loop(self, head: int, budget: int | None) -> tuple[int, int, list | None]
+
+            Returns program counter, number of executed instructions and the path as
+            [(address, (opcode, loper, roper, new_PC), next address)], path is None when
+            the loop can't be traced (call, ret, halt, inner loop, too long) or budget
+            ran out before the loop closed.
+        """
+        supported = [opcodes.movrr, opcodes.movrm, opcodes.movmr, opcodes.movri,
+                     opcodes.push, opcodes.pop, opcodes.jp] + alu_operations + jump_conditions
+        trace = []
+        visited = set()
+        pc = head
+        while True:
+            if budget is not None and len(trace) >= budget:
+                self.back_edges[head] = self.hot_threshold - 1  # try again next time
+                return pc, len(trace), None
+            handler, args, count = self.decode(pc)
+            if args[0] not in supported or pc in visited or len(trace) >= MAX_TRACE:
+                self.cold.add(head)
+                return pc, len(trace), None
+            visited.add(pc)
+            next_pc = handler(*args)
+            trace.append((pc, args, next_pc))
+            pc = next_pc
+            if pc == head:
+                return pc, len(trace), trace
+
+    def compile_superblock(self, head: int, trace: list) -> object:
+        """
+            Function for compiling recorded loop iteration into superblock
+            def compile_superblock(self, head: int, trace: list) -> Callable[[list[int], int | None], tuple[int, int]]
+
+            Superblock block(regs, budget) repeats the iteration while guards hold and
+            budget allows a whole iteration, returns (program counter, instructions).
+            Memory at constant addresses outside of devices mapped at compile time is
+            accessed directly, stack and device accesses go through SEQ.
+        """
+        length = len(trace)
+        lines = ['def superblock(r, budget):',
+                 '    sg, lf, rt, res = engine.alu_state',
+                 '    if budget is None:',
+                 '        budget = -1',
+                 '    n = 0',
+                 '    while budget < 0 or n + {} <= budget:'.format(length)]
+
+        computer = self.computer
+
+        def load(addr):  # constant address outside of devices is read directly
+            if addr < computer.mmio_high and addr + 4 > computer.mmio_low or addr + 4 > len(computer.memory):
+                return 'read32({})'.format(addr)
+            return "from_bytes(mem[{}:{}], 'little')".format(addr, addr + 4)
+
+        def store(addr, value):
+            if addr < computer.mmio_high and addr + 4 > computer.mmio_low or addr + 4 > len(computer.memory):
+                return 'write32({}, {})'.format(addr, value)
+            return "mem[{}:{}] = ({} & MASK).to_bytes(4, 'little')".format(addr, addr + 4, value)
+
+        def signed(value):
+            return '({0} - 0x100000000 if {0} & 0x80000000 else {0})'.format(value)
+
+        def leave(pc, done):
+            return ['        engine.alu_state = (sg, lf, rt, res)',
+                    '        return {}, n + {}'.format(pc, done)]
+
+        for i, (address, (opcode, a, b, new_PC), next_pc) in enumerate(trace):
+            code = ['        # {:#06x}'.format(address)]
+            sign = opcode & (1 << 2)
+            operation = '-' if sign else '+'
+            if opcode == opcodes.movrr:
+                code.append('        r[{}] = r[{}]'.format(a, b))
+            elif opcode == opcodes.movrm:
+                code.append('        r[{}] = {}'.format(a, load(b)))
+            elif opcode == opcodes.movmr:
+                code.append('        {}'.format(store(a, 'r[{}]'.format(b))))
+            elif opcode == opcodes.movri:
+                code.append('        r[{}] = {}'.format(a, b & MASK))
+            elif opcode in [opcodes.addrr, opcodes.subrr]:
+                code.append('        lf = {}; rt = {}'.format(
+                    signed('r[{}]'.format(a)), signed('r[{}]'.format(b))))
+                code.append('        res = lf {} rt; sg = {}; r[{}] = res & MASK'.format(
+                    operation, sign, a))
+            elif opcode in [opcodes.addri, opcodes.subri]:
+                code.append('        lf = {}; rt = {}'.format(
+                    signed('r[{}]'.format(a)), b))
+                code.append('        res = lf {} rt; sg = {}; r[{}] = res & MASK'.format(
+                    operation, sign, a))
+            elif opcode in [opcodes.addrm, opcodes.subrm]:
+                code.append('        m = {}'.format(load(b)))
+                code.append('        lf = {}; rt = {}'.format(
+                    signed('r[{}]'.format(a)), signed('m')))
+                code.append('        res = lf {} rt; sg = {}; r[{}] = res & MASK'.format(
+                    operation, sign, a))
+            elif opcode in [opcodes.addmr, opcodes.submr]:
+                code.append('        m = {}'.format(load(a)))
+                code.append('        lf = {}; rt = {}'.format(
+                    signed('m'), signed('r[{}]'.format(b))))
+                code.append('        res = lf {} rt; sg = {}; {}'.format(
+                    operation, sign, store(a, 'res')))
+            elif opcode == opcodes.push:
+                code.append('        sp = r[{}]; r[{}] = (sp + 4) & MASK; write32(sp, r[{}])'.format(
+                    ESP, ESP, a))
+            elif opcode == opcodes.pop:
+                code.append('        sp = (r[{}] - 4) & MASK; r[{}] = sp; r[{}] = read32(sp)'.format(
+                    ESP, ESP, a))
+            elif opcode in jump_conditions:
+                condition = condition_expressions[opcode]
+                if next_pc == a:  # recorded as taken
+                    code.append('        if not ({}):'.format(condition))
+                    code.extend('    ' + line for line in leave(new_PC, i + 1))
+                else:
+                    code.append('        if {}:'.format(condition))
+                    code.extend('    ' + line for line in leave(a, i + 1))
+            lines.extend(code)
+        lines.append('        n += {}'.format(length))
+        lines.extend(line[4:] for line in leave(head, 0))
+
+        source = '\n'.join(lines) + '\n'
+        namespace = {'engine': self, 'read32': self.read32, 'write32': self.write32,
+                     'mem': computer.memory, 'from_bytes': int.from_bytes, 'MASK': MASK}
+        exec(compile(source, '<superblock {:#06x}>'.format(head), 'exec'), namespace)
+        block = namespace['superblock']
+        addresses = [address for address, args, next_pc in trace]
+        self.superblocks[head] = block
+        self.superblock_ranges[head] = (min(addresses), max(addresses))
+        self.superblock_sources[head] = source
+        return block
+
+    # Memory helpers
+
+    def read32(self, addr: int) -> int:
+        return self.computer.readMem(addr, 4)
+
+    def write32(self, addr: int, value: int) -> None:
+        self.computer.writeMem(addr, (value & MASK).to_bytes(4, 'little'))
+
+    # Instruction handlers
+
+    def movrr(self, opcode, a, b, new_PC):
+        self.regs[a] = self.regs[b]
+        return new_PC
+
+    def movrm(self, opcode, a, b, new_PC):
+        self.regs[a] = self.read32(b)
+        return new_PC
+
+    def movmr(self, opcode, a, b, new_PC):
+        self.write32(a, self.regs[b])
+        return new_PC
+
+    def movri(self, opcode, a, b, new_PC):
+        self.regs[a] = b & MASK
+        return new_PC
+
+    def alu(self, opcode, left, right):
+        sign = opcode & (1 << 2)
+        if sign:
+            result = left - right
+        else:
+            result = left + right
+        self.alu_state = (sign, left, right, result)
+        return result & MASK
+
+    def alu_rr(self, opcode, a, b, new_PC):
+        regs = self.regs
+        regs[a] = self.alu(opcode, twos_components(
+            regs[a]), twos_components(regs[b]))
+        return new_PC
+
+    def alu_ri(self, opcode, a, b, new_PC):
+        regs = self.regs
+        regs[a] = self.alu(opcode, twos_components(regs[a]), b)
+        return new_PC
+
+    def alu_rm(self, opcode, a, b, new_PC):
+        regs = self.regs
+        regs[a] = self.alu(opcode, twos_components(
+            regs[a]), twos_components(self.read32(b)))
+        return new_PC
+
+    def alu_mr(self, opcode, a, b, new_PC):
+        self.write32(a, self.alu(opcode, twos_components(
+            self.read32(a)), twos_components(self.regs[b])))
+        return new_PC
+
+    def push(self, opcode, a, b, new_PC):
+        regs = self.regs
+        sp = regs[ESP]
+        regs[ESP] = (sp + 4) & MASK
+        self.write32(sp, regs[a])
+        return new_PC
+
+    def pop(self, opcode, a, b, new_PC):
+        regs = self.regs
+        sp = (regs[ESP] - 4) & MASK
+        regs[ESP] = sp
+        regs[a] = self.read32(sp)
+        return new_PC
+
+    def call(self, opcode, a, b, new_PC):
+        regs = self.regs
+        sp = regs[ESP]
+        self.write32(sp, new_PC)
+        regs[ESP] = (sp + 4) & MASK
+        return a
+
+    def ret(self, opcode, a, b, new_PC):
+        regs = self.regs
+        sp = (regs[ESP] - 4) & MASK
+        regs[ESP] = sp
+        return self.read32(sp)
+
+    def jp(self, opcode, a, b, new_PC):
+        return a
+
+    def jcc(self, opcode, a, b, new_PC):
+        if condition_holds(opcode, self.alu_state[3]):
+            return a
+        return new_PC
+
+    def halt(self, opcode, a, b, new_PC):
+        return None
+
+    def passop(self, opcode, a, b, new_PC):
+        return new_PC
+
+    # Superinstruction handlers
+
+    def alu_ri_jcc(self, opcode, a, b, jump_opcode, target, new_PC):
+        regs = self.regs
+        left = twos_components(regs[a])
+        if opcode & (1 << 2):
+            result = left - b
+        else:
+            result = left + b
+        self.alu_state = (opcode & (1 << 2), left, b, result)
+        regs[a] = result & MASK
+        if condition_holds(jump_opcode, result):
+            return target
+        return new_PC
+
+    def push_call(self, a, target, new_PC):
+        regs = self.regs
+        sp = regs[ESP]
+        regs[ESP] = (sp + 4) & MASK
+        self.write32(sp, regs[a])
+        sp = regs[ESP]
+        self.write32(sp, new_PC)
+        regs[ESP] = (sp + 4) & MASK
+        return target
+
+    def pop_call(self, a, target, new_PC):
+        regs = self.regs
+        sp = (regs[ESP] - 4) & MASK
+        regs[ESP] = sp
+        regs[a] = self.read32(sp)
+        sp = regs[ESP]
+        self.write32(sp, new_PC)
+        regs[ESP] = (sp + 4) & MASK
+        return target
+
+    def pop_ret(self, a):
+        regs = self.regs
+        sp = (regs[ESP] - 4) & MASK
+        regs[ESP] = sp
+        regs[a] = self.read32(sp)
+        sp = (regs[ESP] - 4) & MASK
+        regs[ESP] = sp
+        return self.read32(sp)
+
+    def movri_alu_ri(self, a, imm, opcode, b, new_PC):
+        self.regs[a] = self.alu(opcode, twos_components(imm & MASK), b)
+        return new_PC
+
+    def movri_alu_rr(self, a, imm, opcode, b, new_PC):
+        regs = self.regs
+        regs[a] = imm & MASK
+        regs[a] = self.alu(opcode, twos_components(
+            regs[a]), twos_components(regs[b]))
+        return new_PC
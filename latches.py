@@ -0,0 +1,77 @@
+class Latch(object):
+    """
+        Pipeline stage register.
+
+        active - latch holds an instruction the stage has not processed yet
+        stat   - status of the instruction (0b0000 - no errors)
+        serial - number of the instruction in fetch order (for pipeline recorder)
+    """
+    __slots__ = ('active', 'stat', 'serial')
+
+    def __init__(self) -> None:
+        for name in self.fields():
+            setattr(self, name, 0)
+        self.active = False
+        self.stat = 0b0000
+
+    @classmethod
+    def fields(cls) -> list[str]:
+        """
+            Function for getting names of all latch fields
+        """
+        names = []
+        for klass in reversed(cls.__mro__):
+            names.extend(getattr(klass, '__slots__', ()))
+        return names
+
+    def as_dict(self) -> dict[str, int]:
+        """
+            Function for getting latch content (for inspectors and tracing)
+        """
+        return {name: getattr(self, name) for name in self.fields()}
+
+
+class DecodeLatch(Latch):
+    """
+        Decode stage registers, written by fetch stage
+    """
+    __slots__ = ('icode', 'ifun', 'rA', 'rB')
+
+
+class ExecuteLatch(Latch):
+    """
+        Execute stage registers, written by decode stage
+    """
+    __slots__ = ('icode', 'ifun', 'valA', 'valB', 'dstE', 'dstM', 'srcA', 'srcB')
+
+
+class MemoryLatch(Latch):
+    """
+        Memory stage registers, written by execute stage
+
+        control - memory stage action:
+            0 - nothing
+            1 - write valA into memory at valE
+            2 - send valA to write back into register valE
+            3 - read memory at valE and write it back into register valA
+    """
+    __slots__ = ('icode', 'valE', 'valA', 'dstE', 'dstM', 'control')
+
+    def writes_register(self) -> int | None:
+        """
+            Function for getting register the instruction will write back (None if any)
+        """
+        if self.stat != 0b0000:
+            return None
+        if self.control == 2:
+            return self.valE
+        if self.control == 3:
+            return self.valA
+        return None
+
+
+class WriteBackLatch(Latch):
+    """
+        Write back stage registers, written by memory stage
+    """
+    __slots__ = ('icode', 'valE', 'valM', 'dstE', 'dstM')
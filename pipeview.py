@@ -0,0 +1,201 @@
+STAGES = 'FDEMW'
+
+
+class InstructionRecord(object):
+    """
+        Cycles one instruction spent in pipeline stages
+
+        first[i], last[i] - first and last cycle instruction occupied stage STAGES[i]
+                            (None if it never reached the stage)
+    """
+    __slots__ = ('serial', 'address', 'opcode', 'first', 'last', 'squashed')
+
+    def __init__(self, serial: int, address: int, opcode: int) -> None:
+        self.serial = serial
+        self.address = address
+        self.opcode = opcode
+        self.first = [None]*5
+        self.last = [None]*5
+        self.squashed = False   # flushed from the pipeline by halt
+
+    def start(self) -> int:
+        return self.first[0]
+
+    def end(self) -> int:
+        return max(cycle for cycle in self.last if cycle is not None)
+
+
+class PipelineRecorder(object):
+    """
+        Table of pipeline stage occupancy of the last capacity fetched instructions.
+
+        SEQ.record_pipeline() attaches the recorder, the pipeline calls fetch() for every
+        fetched instruction and stage() for every cycle an instruction occupies a stage.
+        Records live in a ring buffer indexed by instruction serial number, so memory is
+        bounded on long runs. The table is exported for a cycle window by text(), csv()
+        and html().
+    """
+
+    def __init__(self, capacity: int = 4096, names: dict[int, str] | None = None) -> None:
+        self.capacity: int = capacity
+        self.records: list[InstructionRecord | None] = [None]*capacity
+        self.names: dict[int, str] = names or {}  # opcode -> mnemonic
+        self.fetched: int = 0   # number of recorded instructions
+
+    def fetch(self, serial: int, address: int, opcode: int) -> None:
+        """
+            Function for adding record of newly fetched instruction
+        """
+        self.records[serial % self.capacity] = InstructionRecord(
+            serial, address, opcode)
+        self.fetched += 1
+
+    def get(self, serial: int) -> InstructionRecord | None:
+        """
+            Function for getting record by serial number (None if it was overwritten)
+        """
+        record = self.records[serial % self.capacity]
+        if record is None or record.serial != serial:
+            return None
+        return record
+
+    def stage(self, serial: int, stage: int, cycle: int) -> None:
+        """
+            Function for marking instruction as occupying stage in cycle
+        """
+        record = self.get(serial)
+        if record is None:
+            return
+        if record.first[stage] is None:
+            record.first[stage] = cycle
+        record.last[stage] = cycle
+
+    def squash(self, serial: int) -> None:
+        record = self.get(serial)
+        if record is not None:
+            record.squashed = True
+
+    def rows(self, start: int | None = None, end: int | None = None) -> list[InstructionRecord]:
+        """
+            Function for getting records of instructions in pipeline during cycles [start, end)
+            def rows(self, start: int | None = None, end: int | None = None) -> list[InstructionRecord]
+        """
+        rows = []
+        for record in self.records:
+            if record is None or record.first[0] is None:
+                continue
+            if end is not None and record.start() >= end:
+                continue
+            if start is not None and record.end() < start:
+                continue
+            rows.append(record)
+        rows.sort(key=lambda record: record.serial)
+        return rows
+
+    def window(self, rows: list[InstructionRecord], start: int | None, end: int | None) -> range:
+        """
+            Function for getting cycles shown by exporters
+        """
+        if start is None:
+            start = min((record.start() for record in rows), default=0)
+        if end is None:
+            end = max((record.end() for record in rows), default=-1) + 1
+        return range(start, end)
+
+    def name(self, record: InstructionRecord) -> str:
+        return self.names.get(record.opcode, hex(record.opcode))
+
+    def cells(self, record: InstructionRecord, cycles: range) -> list[str]:
+        """
+            Function for getting stage letter of instruction in each cycle ('' - not in pipeline)
+
+            Stalls are shown by repeating the stage letter, cycles waiting in stage
+            registers for the next stage by '-'.
+        """
+        cells = ['']*len(cycles)
+        previous = None  # last cycle of previous reached stage
+        for stage in range(5):
+            if record.first[stage] is None:
+                continue
+            if previous is not None:  # waiting in stage registers
+                for cycle in range(max(previous + 1, cycles.start), min(record.first[stage], cycles.stop)):
+                    cells[cycle - cycles.start] = '-'
+            for cycle in range(max(record.first[stage], cycles.start), min(record.last[stage] + 1, cycles.stop)):
+                cells[cycle - cycles.start] = STAGES[stage]
+            previous = record.last[stage]
+        return cells
+
+    def text(self, start: int | None = None, end: int | None = None) -> str:
+        """
+            Function for getting classic pipeline diagram as text
+            def text(self, start: int | None = None, end: int | None = None) -> str
+        """
+        rows = self.rows(start, end)
+        cycles = self.window(rows, start, end)
+        width = max([len(str(cycle)) for cycle in cycles] + [1])
+        lines = ['{:<20}'.format('') + ' '.join('{:>{}}'.format(cycle, width)
+                                                for cycle in cycles)]
+        for record in rows:
+            label = '{:#06x} {}'.format(record.address, self.name(record))
+            if record.squashed:
+                label += ' x'
+            cells = self.cells(record, cycles)
+            lines.append('{:<20}'.format(label) + ' '.join(
+                '{:>{}}'.format(cell or '.', width) for cell in cells))
+        return '\n'.join(lines) + '\n'
+
+    def csv(self, start: int | None = None, end: int | None = None) -> str:
+        """
+            Function for getting entry and exit cycle of every stage as CSV
+            def csv(self, start: int | None = None, end: int | None = None) -> str
+        """
+        header = ['serial', 'address', 'instruction']
+        for stage in STAGES:
+            header += [stage + '_entry', stage + '_exit']
+        lines = [','.join(header + ['squashed'])]
+        for record in self.rows(start, end):
+            fields = [str(record.serial), hex(record.address), self.name(record)]
+            for stage in range(5):
+                for cycle in (record.first[stage], record.last[stage]):
+                    fields.append('' if cycle is None else str(cycle))
+            fields.append(str(int(record.squashed)))
+            lines.append(','.join(fields))
+        return '\n'.join(lines) + '\n'
+
+    def html(self, start: int | None = None, end: int | None = None) -> str:
+        """
+            Function for getting pipeline diagram as standalone HTML table
+            def html(self, start: int | None = None, end: int | None = None) -> str
+        """
+        colors = {'F': '#cde', 'D': '#dfd', 'E': '#fed',
+                  'M': '#fdf', 'W': '#eee', '-': '#fff'}
+        rows = self.rows(start, end)
+        cycles = self.window(rows, start, end)
+        lines = ['<!DOCTYPE html>', '<html><head><meta charset="utf-8"><style>',
+                 'table{border-collapse:collapse;font:12px monospace}',
+                 'td,th{border:1px solid #ccc;padding:1px 4px;text-align:center}',
+                 'td.name{text-align:left}tr.squashed{color:#999}',
+                 '</style></head><body><table>',
+                 '<tr><th>instruction</th>' + ''.join('<th>{}</th>'.format(cycle) for cycle in cycles) + '</tr>']
+        for record in rows:
+            cells = ''.join(
+                '<td style="background:{}">{}</td>'.format(colors[cell], cell) if cell else '<td></td>'
+                for cell in self.cells(record, cycles))
+            lines.append('<tr{}><td class="name">{:#06x} {}</td>{}</tr>'.format(
+                ' class="squashed"' if record.squashed else '', record.address, self.name(record), cells))
+        lines.append('</table></body></html>')
+        return '\n'.join(lines) + '\n'
+
+    def export(self, file_name: str, start: int | None = None, end: int | None = None) -> None:
+        """
+            Function for writing diagram into file, format is chosen by extension
+            (.csv, .html/.htm, anything else - text)
+        """
+        if file_name.endswith('.csv'):
+            content = self.csv(start, end)
+        elif file_name.endswith('.html') or file_name.endswith('.htm'):
+            content = self.html(start, end)
+        else:
+            content = self.text(start, end)
+        with open(file_name, 'w') as f:
+            f.write(content)
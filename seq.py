@@ -1,8 +1,15 @@
-import struct
-from typing import List
-from asm_parser import asm_parser
-from time import sleep
-from utils import regfile, twos_components
+import weakref
+from bisect import bisect_right
+from utils import regfile, twos_components, alu_flags
+from latches import DecodeLatch, ExecuteLatch, MemoryLatch, WriteBackLatch
+
+HOT_THRESHOLD = 50  # taken back edges before engine.FastEngine traces a loop
+
+
+def quiet(*args, **kwargs) -> None:
+    """
+        Function replacing print when trace is disabled
+    """
 
 
 class opcodes(enumerate):  # Instruction opcodes(6 bits lenght)
@@ -39,88 +46,80 @@ class opcodes(enumerate):  # Instruction opcodes(6 bits lenght)
     passop = 0b00100000
 
 
+ESP = 7  # stack pointer register
+jump_conditions = [opcodes.jnz, opcodes.jne, opcodes.je,
+                   opcodes.jge, opcodes.jle, opcodes.jg, opcodes.jl]
+opcode_names = {value: name for name, value in vars(opcodes).items()
+                if not name.startswith('_')}  # opcode -> mnemonic
+
+
 class SEQ(object):
-    def __init__(self, bits, memory) -> None:
+    def __init__(self, bits, memory, memory_buffer=None) -> None:
         self.bits: int = bits  # System type
         self.memsize: int = memory  # memory size (in bytes)
-        self.memory: bytearray = bytearray(memory)  # memory bytearray
-
-        self.status_flags = {
-            'CF': 0b0,  # carry flag
+        if memory_buffer is None:
+            memory_buffer = bytearray(memory)
+        # memory bytearray (or buffer shared with other cores)
+        self.memory: bytearray = memory_buffer
+
+        # Memory mapped devices: (start, end, device) sorted by start, starts are the
+        # index searched with bisect. Accesses outside [mmio_low, mmio_high) skip it.
+        self.devices: list[tuple] = []
+        self.device_starts: list[int] = []
+        self.mmio_low = 0
+        self.mmio_high = 0
+
+        # Engines caching decoded code, dropped by invalidate() when memory changes
+        # behind them (not referenced, engines are replaced without unregistering)
+        self.engines = weakref.WeakSet()
+
+        self.control_flags = {
             'PF': 0b0,  # parity flag
             'AF': 0b0,  # adjust flag
-            'ZF': 0b0,  # zero flag
-            'SF': 0b0,  # sign flag
             'TF': 0b0,  # trap flag
             'IF': 0b0,  # Interrupt enable flag
             'DF': 0b0,  # direction flag
-            'OF': 0b0,  # overflow flag
-        }  # Status flags for last operation
+        }  # Flags not produced by ALU operations
+
+        # Last ALU operation: (sign, left operand, right operand, result).
+        # ZF, SF, OF and CF are derived from it only when they are asked for.
+        self.alu_state = (0, 0, 0, 1)
+        self.flags_cache = None     # alu_state the cached flags belong to
+        self.flags_cached = None    # derived flags for flags_cache
 
-        self.registers: List[bytearray] = bytearray(
+        self.registers: bytearray = bytearray(
             4*16)  # registers byte array
 
-        # Decode stage registers
-        self.decode_registers: dict[str, None | int] = {
-            'stat': 0b0000,
-            'icode': None,
-            'ifun': None,
-            'rA': None,
-            'rB': None,
-            'valP': None
-        }
-
-        # Execute stage registers
-        self.execute_registers: dict[str, None | int] = {
-            'stat': 0b0000,
-            'icode': None,
-            'ifun': None,
-            'valA': None,
-            'valB': None,
-            'dstE': None,
-            'dstM': None,
-            'srcA': None,
-            'dstM': None,
-            'srcA': None,
-            'srcB': None
-        }
-
-        # Memory stage registers
-        self.memory_registers: dict[str, None | int] = {
-            'stat': 0b000,
-            'icode': None,
-            'valE': None,
-            'valA': None,
-            'dstE': None,
-            'dstM': None
-        }
-
-        # Write back stage registers
-        self.write_back_registers: dict[str, None | int] = {
-            'stat': 0b0000,
-            'icode': None,
-            'valE': None,
-            'valM': None,
-            'dstE': None,
-            'dstM': None
-        }
-
-        # Stage activation flags
-        # 0 - Fetch stage
-        # 1 - Decode stage
-        # 2 - Execute stage
-        # 3 - Memory stage
-        # 4 - Write back stage
-        self.stage_active = [False]*5
+        # Stage registers are double buffered: stages read current latches and write
+        # next ones, all latches are committed at the end of a cycle.
+        self.decode_registers = DecodeLatch()
+        self.execute_registers = ExecuteLatch()
+        self.memory_registers = MemoryLatch()
+        self.write_back_registers = WriteBackLatch()
+        self.next_decode_registers = DecodeLatch()
+        self.next_execute_registers = ExecuteLatch()
+        self.next_memory_registers = MemoryLatch()
+        self.next_write_back_registers = WriteBackLatch()
 
         # Program counter
         self.PC = 0x0000
 
-        # Memory control flag
-        self.memory_control = 0b00
+        # Pipeline control state (kept between compute() calls)
+        self.stop_computing = False     # halt was executed
+        self.finish_prev = 3            # cycles left to finish instructions before halt
+        self.top_stage = 4              # first stage to process in a cycle
+        self.bottom_stage = -1          # stage after the last one to process in a cycle
+        self.finish_write_back = False  # execute stage waits for write back
+        self.update_flag = False        # conditional jump waits for status flags
+
+        self.cycles = 0     # number of executed cycles
+        self.retired = 0    # number of completed instructions
+        self.delay = 0      # pause after every cycle (seconds) to follow the trace
+        self.trace = False  # print stages of every cycle
 
-        # Write back control flag
-        self.write_back_control = 0b0
+        self.fetched = 0            # serial number of next fetched instruction
+        self.fetch_serial = None    # serial of instruction fetch stage is working on
+        self.recorder = None        # pipeview.PipelineRecorder (record_pipeline())
 
     def readMem(self, addr: str | int, num_of_bytes: int) -> int:
         """
@@ -138,6 +137,10 @@ class SEQ(object):
         """
         if type(addr) == type('str'):
             addr = int(addr, 16)
+        if addr < self.mmio_high and addr + num_of_bytes > self.mmio_low:
+            found = self.find_device(addr, num_of_bytes)
+            if found is not None:
+                return found[2].read(addr - found[0], num_of_bytes)
         return int.from_bytes(self.memory[addr: addr+num_of_bytes], 'little')
 
     def writeMem(self, addr: int | str, data: bytearray) -> bool:
@@ -151,9 +154,77 @@ class SEQ(object):
         """
         if type(addr) == type(''):
             addr = int(addr, 16)
+        if addr < self.mmio_high and addr + len(data) > self.mmio_low:
+            found = self.find_device(addr, len(data))
+            if found is not None:
+                found[2].write(addr - found[0], bytes(data))
+                return
         for i in range(len(data)):
             self.memory[addr + i] = data[i]
 
+    def add_device(self, address: int, device) -> None:
+        """
+            Function for mapping device registers into memory
+            def add_device(self, address: int, device: devices.Device) -> None
+
+            Reads and writes of [address, address + device.size) go to the device
+            instead of memory. Ranges of devices must not overlap.
+        """
+        end = address + device.size
+        for start, device_end, other in self.devices:
+            if address < device_end and start < end:
+                raise Exception('Device at {:#x} overlaps device at {:#x}'.format(
+                    address, start))
+        device.attach(self)
+        self.devices.append((address, end, device))
+        self.devices.sort(key=lambda item: item[0])
+        self.device_starts = [item[0] for item in self.devices]
+        self.mmio_low = self.devices[0][0]
+        self.mmio_high = max(item[1] for item in self.devices)
+        self.invalidate()  # compiled code may access the new range as memory
+
+    def find_device(self, addr: int, num_of_bytes: int = 1) -> tuple | None:
+        """
+            Function for getting (start, end, device) mapped at [addr, addr + num_of_bytes)
+            def find_device(self, addr: int, num_of_bytes: int = 1) -> tuple | None
+
+            Returns None if the bytes are memory, raises Exception if they are only
+            partly inside the device.
+        """
+        i = bisect_right(self.device_starts, addr + num_of_bytes - 1) - 1
+        if i < 0 or addr >= self.devices[i][1]:
+            return None
+        start, end, device = self.devices[i]
+        if addr < start or addr + num_of_bytes > end:
+            raise Exception('Access of {} bytes at {:#x} crosses boundary of device at {:#x}'.format(
+                num_of_bytes, addr, start))
+        return self.devices[i]
+
+    def add_engine(self, engine) -> None:
+        """
+            Function for registering engine to be invalidated with invalidate()
+            def add_engine(self, engine: engine.FastEngine) -> None
+        """
+        self.engines.add(engine)
+
+    def invalidate(self, start: int | None = None, end: int | None = None) -> None:
+        """
+            Function for dropping code cached by engines
+            def invalidate(self, start: int | None = None, end: int | None = None) -> None
+
+            Called when memory [start, end) was written around writeMem() (e.g. by
+            device), or with no arguments when device mapping changed.
+        """
+        for engine in list(self.engines):
+            engine.invalidate(start, end)
+
+    def flush_devices(self) -> None:
+        """
+            Function for performing delayed side effects of devices (console output, written blocks)
+        """
+        for start, end, device in self.devices:
+            device.flush()
+
     def writeReg(self, reg: int, data: bytearray) -> None:
         """
             Function for writting into registers
@@ -170,13 +241,25 @@ class SEQ(object):
         """
             Function for reading from registers
         """
-        return struct.unpack('<I', self.registers[4*reg: 4*reg+4])[0]
+        return int.from_bytes(self.registers[4*reg: 4*reg+4], 'little')
 
     def fetch_instruction(self, instruction_address):
         """
             Fethching instruction
             def fetch_instruction(self, instruction_address: int | str)
 
+            Decodes instruction at instruction_address and prints operation data.
+        """
+        operation_data = self.decode_instruction(instruction_address)
+        if self.trace:
+            print(operation_data)
+        return operation_data
+
+    def decode_instruction(self, instruction_address):
+        """
+            Decoding instruction without side effects
+            def decode_instruction(self, instruction_address: int | str) -> list
+
             instruction_address - int or string with number.
 
             0       7 8         11 12         15 16             47
@@ -204,378 +287,542 @@ class SEQ(object):
         loperand = (instruction >> 8) & ((1 << 4) - 1)
         roperand = (instruction >> 12) & ((1 << 4) - 1)
         immediate = twos_components(instruction >> 16)
-        print(immediate)
 
         # Operation data is an array with 3 items
         operation_data = [opcode, loperand, roperand, new_PC]
 
-        if opcode in [opcodes.movmr, opcodes.addmr, opcodes.jnz, opcodes.je, opcodes.jp, opcodes.jne, opcodes.call, opcodes.jg, opcodes.jl, opcodes.jle, opcodes.jge]:
+        if opcode in [opcodes.movmr, opcodes.addmr, opcodes.submr, opcodes.jnz, opcodes.je, opcodes.jp, opcodes.jne, opcodes.call, opcodes.jg, opcodes.jl, opcodes.jle, opcodes.jge]:
             operation_data[1] = immediate  # Immediate value is left operand
-        elif opcode in [opcodes.movrm, opcodes.addrm, opcodes.movri, opcodes.addri, opcodes.subri, opcodes.subrm, opcodes.submr]:
+        elif opcode in [opcodes.movrm, opcodes.addrm, opcodes.movri, opcodes.addri, opcodes.subri, opcodes.subrm]:
             operation_data[2] = immediate  # Immediate value is right operand
 
         return operation_data
 
-    def compute(self):
+    def compute(self, max_cycles: int | None = None, max_instructions: int | None = None, deadline: float | None = None) -> str:
         """
             Function for reading and executing instructions from memory
-            def compute()
+            def compute(max_cycles: int | None = None, max_instructions: int | None = None, deadline: float | None = None) -> str
 
             It fetches instructions from memory at address stored in self.PC(program counter).
 
             It gets opcode, left_operand, right_operang, immediate value from function fetch_instruction(instruction_address).
 
+            Limits are checked between cycles:
+                max_cycles          - number of cycles to run in this call
+                max_instructions    - number of instructions to retire in this call
+                deadline            - time.monotonic() value to stop at
+            Returns 'halted' or name of the limit that stopped computing. Pipeline state is
+            kept in the object, so next compute() call resumes exactly where this one stopped.
+            Delayed side effects of devices are performed when computing stops.
         """
-        stop_computing = False
-        finish_prev = 3
-        top_stage = 4
-        bottom_stage = -1
-        finish_write_back = False
-        update_flag = False
-        while not stop_computing or finish_prev > 0:
-            print()
-            print(self.PC)
-            opcode, loper, roper, new_PC = self.fetch_instruction(
-                self.PC)
-            self.stage_active[0] = True
-            complete_steps = ""
-            for i in range(top_stage, bottom_stage, -1):
-                if not self.stage_active[i]:
+        try:
+            return self.run_cycles(max_cycles, max_instructions, deadline)
+        finally:
+            if self.devices:
+                self.flush_devices()
+
+    def run_cycles(self, max_cycles: int | None, max_instructions: int | None, deadline: float | None) -> str:
+        """
+            Function for running cycles until halt or one of compute() limits
+        """
+        if deadline is not None:
+            import time
+        start_cycles = self.cycles
+        start_retired = self.retired
+        while not self.halted:
+            if max_cycles is not None and self.cycles - start_cycles >= max_cycles:
+                return 'max_cycles'
+            if max_instructions is not None and self.retired - start_retired >= max_instructions:
+                return 'max_instructions'
+            if deadline is not None and time.monotonic() >= deadline:
+                return 'deadline'
+            self.cycle()
+        return 'halted'
+
+    def compute_slices(self, slice_cycles: int, max_cycles: int | None = None, max_instructions: int | None = None, deadline: float | None = None):
+        """
+            Resumable form of compute()
+            def compute_slices(slice_cycles: int, ...) -> Generator[dict]
+
+            Yields {'status', 'cycles', 'retired', 'pc'} every slice_cycles cycles. Status is
+            'running' while computing can continue, last yielded status is the compute() one.
+            Limits are the same as in compute() and count from the first slice.
+            slice_cycles lower than 1 raises Exception.
+        """
+        if slice_cycles < 1:
+            raise Exception('Slice must be at least 1 cycle: {}'.format(slice_cycles))
+        start_cycles = self.cycles
+        start_retired = self.retired
+        while True:
+            budget = slice_cycles
+            if max_cycles is not None:
+                budget = min(budget, max_cycles - (self.cycles - start_cycles))
+            instructions = None
+            if max_instructions is not None:
+                instructions = max_instructions - (self.retired - start_retired)
+            status = self.compute(budget, instructions, deadline)
+            if status == 'max_cycles' and (max_cycles is None or self.cycles - start_cycles < max_cycles):
+                status = 'running'
+            yield {
+                'status': status,
+                'cycles': self.cycles - start_cycles,
+                'retired': self.retired - start_retired,
+                'pc': self.PC,
+            }
+            if status != 'running':
+                return
+
+    @property
+    def halted(self) -> bool:
+        """
+            True when halt reached write back and no more cycles are needed
+        """
+        return self.stop_computing and self.finish_prev <= 0
+
+    def cycle(self) -> None:
+        """
+            Function for executing one pipeline cycle
+            def cycle(self) -> None
+
+            Stages are processed from write back to fetch. Each stage reads only current
+            stage registers and writes next ones, commit_latches() makes them current at
+            the end of the cycle. The order is kept for register file and memory: write
+            back stores a register before execute reads it in the same cycle.
+        """
+        trace = self.trace
+        log = print if trace else quiet
+        rec = self.recorder
+        cycle = self.cycles
+        log()
+        log(self.PC)
+        opcode, loper, roper, new_PC = self.fetch_instruction(
+            self.PC)
+
+        d = self.decode_registers
+        e = self.execute_registers
+        m = self.memory_registers
+        w = self.write_back_registers
+        nd = self.next_decode_registers
+        ne = self.next_execute_registers
+        nm = self.next_memory_registers
+        nw = self.next_write_back_registers
+        nd.active = ne.active = nm.active = nw.active = False
+        consumed = [False]*5  # stage processed (or flushed) its current registers
+        fetch_done = False    # fetch stage finished with its instruction
+
+        complete_steps = ""  # completed stages, built only for trace
+        for i in range(self.top_stage, self.bottom_stage, -1):
+            if i == 4:
+                """
+                    SEQ's Write-back stage
+                    At this stage data is written back to destination register
+                """
+                if not w.active:
                     continue
-                if i == 4:
-                    """
-                        SEQ's Write-back stage
-                        At this stage data is written back to destination register
-                    """
-                    if not self.write_back_registers['stat'] == 0b0000:  # Checking for errors
-                        print('Write back error')
-                    self.writeReg(
-                        self.write_back_registers['valE'], self.write_back_registers['valM'].to_bytes(4, 'little'))
-                    self.write_back_control = 0
-                    if finish_write_back:  # Finishing write-back for source register at execute stage
-                        print('Written back: {} {}'.format(
-                            self.write_back_registers['valE'], self.write_back_registers['valM']))
-                        top_stage = 4
-                        bottom_stage = -1   # executing all active stages
-                    self.stage_active[4] = False            # Disable stage
+                if rec is not None:
+                    rec.stage(w.serial, 4, cycle)
+                if not w.stat == 0b0000:  # Checking for errors
+                    log('Write back error')
+                self.writeReg(w.valE, w.valM.to_bytes(4, 'little'))
+                if self.finish_write_back:  # Finishing write-back for source register at execute stage
+                    log('Written back: {} {}'.format(w.valE, w.valM))
+                    self.top_stage = 4
+                    self.bottom_stage = -1   # executing all active stages
+                consumed[4] = True                      # Disable stage
+                if trace:
                     complete_steps = "W" + complete_steps   # Add to completed stages info
-                elif i == 3:
-                    """
-                        SEQ's Memory stage
-                        At this stage data is written into memory or sent to written back stage
-                    """
-                    if not self.memory_registers['stat'] == 0b0000:  # Checking for errors
-                        print('Memory stage error')
-                    elif self.memory_control == 1:  # Writting into memory
-                        print('M: Writing into memory: {}, {}'.format(
-                            self.memory_registers['valE'], self.memory_registers['valA']))
-                        # Writting into memory_address stored at valE, data is stored at valA
-                        self.writeMem(
-                            self.memory_registers['valE'], self.memory_registers['valA'].to_bytes(4, 'little'))
-                        self.memory_control = 0
-                    elif self.memory_control == 2:  # Sending to write-back stage
-                        print('M: Send to write back: ', end="")
-                        print(
-                            self.memory_registers['valE'], self.memory_registers['valA'])
-                        # For write-back stage: valE - destination register address, valM - value to store.
-                        self.write_back_registers['valE'] = self.memory_registers['valE']
-                        self.write_back_registers['valM'] = self.memory_registers['valA']
-                        self.memory_control = 0
-                        # Activate Write-back stage
-                        self.stage_active[4] = True
-                    elif self.memory_control == 3:
-                        self.write_back_registers['valE'] = self.memory_registers['valA']
-                        self.write_back_registers['valM'] = self.readMem(
-                            self.memory_registers['valE'], 4)
-                        # Activate Write-back stage
-                        self.stage_active[4] = True
-                        self.memory_control = 0
-
-                    self.write_back_registers['stat'] = self.write_back_registers['stat']
-                    self.write_back_registers['dstE'] = self.memory_registers['dstE']
-                    self.write_back_registers['dstM'] = self.memory_registers['dstM']
-                    self.write_back_registers['icode'] = self.memory_registers['icode']
-                    self.stage_active[3] = False    # Disable memory stage
+            elif i == 3:
+                """
+                    SEQ's Memory stage
+                    At this stage data is written into memory or sent to written back stage
+                """
+                if not m.active:
+                    continue
+                if rec is not None:
+                    rec.stage(m.serial, 3, cycle)
+                if not m.stat == 0b0000:  # Checking for errors
+                    log('Memory stage error')
+                elif m.control == 1:  # Writting into memory
+                    log('M: Writing into memory: {}, {}'.format(m.valE, m.valA))
+                    # Writting into memory_address stored at valE, data is stored at valA
+                    self.writeMem(m.valE, m.valA.to_bytes(4, 'little'))
+                elif m.control == 2:  # Sending to write-back stage
+                    log('M: Send to write back: ', end="")
+                    log(m.valE, m.valA)
+                    # For write-back stage: valE - destination register address, valM - value to store.
+                    nw.valE = m.valE
+                    nw.valM = m.valA
+                    # Activate Write-back stage
+                    nw.active = True
+                elif m.control == 3:
+                    nw.valE = m.valA
+                    nw.valM = self.readMem(m.valE, 4)
+                    # Activate Write-back stage
+                    nw.active = True
+
+                nw.stat = w.stat
+                nw.serial = m.serial
+                nw.dstE = m.dstE
+                nw.dstM = m.dstM
+                nw.icode = m.icode
+                consumed[3] = True    # Disable memory stage
+                self.retired += 1
+                if trace:
                     complete_steps = "M" + complete_steps
-                elif i == 2:
-                    """
-                        SEQ's Execute stage
-                        At this stage instructions are executed.
-                    """
+            elif i == 2:
+                """
+                    SEQ's Execute stage
+                    At this stage instructions are executed.
+                """
+                if not e.active:
+                    continue
+                if rec is not None:
+                    rec.stage(e.serial, 2, cycle)
+                if trace:
                     complete_steps = "E" + complete_steps
-                    # Checking for errors
-                    if not self.execute_registers['stat'] == 0:
-                        print('Execute stage error')
-                    else:
-                        # Calculating instruction opcode from instruction code and functional code
-
-                        exec_opcode = self.execute_registers['icode'] * \
-                            8 + self.execute_registers['ifun']
-
-                        # If source register is now destination register at write-back stage, we need to want until
-                        # data will be stored in it.
-                        if self.write_back_registers['valE'] == self.execute_registers['valB'] and exec_opcode in [opcodes.movrr, opcodes.addrr, opcodes.addmr, opcodes.submr] and self.stage_active[4]:
-                            print('E: Waiting register to be written back')
-                            top_stage = 4
-                            bottom_stage = 2
-                            finish_write_back = True
-                            break  # breaking to wait until write-back stage
-
-                        if self.write_back_registers['valE'] == self.execute_registers['valA'] and exec_opcode in [opcodes.movrr, opcodes.addrr, opcodes.addrm, opcodes.subrm, opcodes.subri, opcodes.subrr, opcodes.push] and self.stage_active[4]:
-                            print('E: Waiting register to be written back')
-                            top_stage = 4
-                            bottom_stage = 2
-                            finish_write_back = True
-                            break  # breaking to wait until write-back stage
-
-                        # Checking opcode type
-                        if exec_opcode == opcodes.movrr:
-                            print('E: movrr {}, {}'.format(
-                                self.execute_registers['valA'], self.execute_registers['valB']))  # Printing operation
-
-                            # Left operand becomes memory_address
-                            self.memory_registers['valE'] = self.execute_registers['valA']
-                            self.memory_registers['valA'] = self.readReg(
-                                self.execute_registers['valB'])  # From register address we get source register data and store it at valA of mem stage
-
-                            # memory_control value for sending from memory stage to write-back stage
-                            self.memory_control = 2
-                        elif exec_opcode == opcodes.movrm:
-                            self.memory_registers['valA'] = self.readMem(
-                                self.execute_registers['valB'])  # Getting value from valB address and send it to valA of mem stage
-                            # sending destination register
-                            self.memory_registers['valE'] = self.execute_registers['valA']
-                            print('E: movrm {}, {}'.format(
-                                self.memory_registers['valE'], self.memory_registers['valA']))
-                            # Set up memory control for sending from memory stage to write-back stage
-                            self.memory_control = 2
-                        elif exec_opcode == opcodes.movmr:
-                            print('E: movmr {}, {}'.format(
-                                self.execute_registers['valA'], self.execute_registers['valB']))  # Printing instruction
-
-                            # sending memory_address to the memory stage
-                            self.memory_registers['valE'] = self.execute_registers['valA']
-                            self.memory_registers['valA'] = self.readReg(
-                                self.execute_registers['valB'])  # Getting value from source register
-                            self.memory_control = 1  # setting memory contol to write into memory
-                        elif exec_opcode == opcodes.movri:
-                            # Sending register address to memory stage
-                            self.memory_registers['valE'] = self.execute_registers['valA']
-                            self.memory_registers['valA'] = twos_components(
-                                self.execute_registers['valB'])  # Sending immediate value to memory stage
-                            print('E: movri {}, {}'.format(
-                                self.memory_registers['valE'], self.memory_registers['valA']))
-                            self.memory_control = 2  # setting memory control for writting back
-
-                        elif exec_opcode in [opcodes.addrr, opcodes.addmr, opcodes.addrm, opcodes.addri, opcodes.subrr, opcodes.subri, opcodes.submr, opcodes.subrm]:
-                            left_operand = 0
-                            right_operand = 0
-                            sign = (exec_opcode & (1 << 2))
-
-                            if exec_opcode == opcodes.addrr or exec_opcode == opcodes.subrr:
-                                left_operand = twos_components(
-                                    self.readReg(self.execute_registers['valA']))
-                                right_operand = twos_components(
-                                    self.readReg(self.execute_registers['valB']))
-                                self.memory_control = 2
-                            elif exec_opcode == opcodes.addri or exec_opcode == opcodes.subri:
-                                left_operand = twos_components(
-                                    self.readReg(self.execute_registers['valA']))
-                                right_operand = self.execute_registers['valB']
-                                self.memory_control = 2
-                            elif exec_opcode == opcodes.addrm or exec_opcode == opcodes.subrm:
-                                left_operand = twos_components(
-                                    self.readReg(self.execute_registers['valA']))
-                                right_operand = twos_components(
-                                    self.readMem(self.execute_registers['valB']))
-                                self.memory_control = 2
-                            elif exec_opcode == opcodes.addmr or exec_opcode == opcodes.addmr:
-                                left_operand = twos_components(
-                                    self.readMem(self.execute_registers['valA']))
-                                right_operand = twos_components(
-                                    self.readReg(self.execute_registers['valB']))
-                                self.memory_control = 1
-
-                            operation_result = None
-
-                            if sign:
-                                print('sub operation: {} {}'.format(
-                                    left_operand, right_operand))
-                                operation_result = left_operand - right_operand
-                            else:
-                                print('add operation: {} {}'.format(
-                                    left_operand, right_operand))
-                                operation_result = left_operand + right_operand
-
-                            if operation_result == 0:
-                                self.status_flags['ZF'] = 1
-                            else:
-                                self.status_flags['ZF'] = 0
-                            if operation_result >= (1 << 32) or operation_result < -(1 << 32):
-                                self.status_flags['OF'] = 1
-                            else:
-                                self.status_flags['OF'] = 0
-                            if operation_result < 0:
-                                self.status_flags['SF'] = 1
-                            else:
-                                self.status_flags['SF'] = 0
-
-                            self.memory_registers['valE'] = self.execute_registers['valA']
-                            print("Opetation result: {}".format(
-                                operation_result))
-                            self.memory_registers['valA'] = twos_components(
-                                operation_result)
-
-                        elif exec_opcode == opcodes.push:
-                            print('Push from {}'.format(
-                                self.execute_registers['valA']))
-                            self.memory_registers['valE'] = self.readReg(7)
-                            self.set_stack_pointer(self.readReg(7) + 4)
-                            self.memory_registers['valA'] = self.readReg(
-                                self.execute_registers['valA'])
-                            self.memory_control = 1
-
-                        elif exec_opcode == opcodes.pop:
-                            print('POP to {}'.format(
-                                self.execute_registers['valA']))
-                            self.set_stack_pointer(self.readReg(7) - 4)
-                            self.memory_registers['valE'] = self.readReg(7)
-                            self.memory_registers['valA'] = self.execute_registers['valA']
-                            self.memory_control = 3
-
-                        elif exec_opcode == opcodes.halt:
-                            # Next operation are cancelled
-                            self.stage_active[0], self.stage_active[1], self.stage_active[2] = False, False, False
-                            stop_computing = True  # to exit from loop
-                            print('E: halt')
-                            top_stage = 4
-                            bottom_stage = 3  # Next stage will be only: write-back and memory to wait data to write into memory or registers
-                            break
-
-                        elif exec_opcode == opcodes.passop:
-                            # This instruction does nothing
-                            print('E: Instruction passoped')
-                            self.memory_control = 0
+                nm.control = 0
+                # Checking for errors
+                if not e.stat == 0:
+                    log('Execute stage error')
+                else:
+                    # Calculating instruction opcode from instruction code and functional code
+
+                    exec_opcode = e.icode * 8 + e.ifun
+
+                    # If source register is destination register of the instruction at memory stage,
+                    # we need to want until data will be stored in it.
+                    written = m.writes_register() if m.active else None
+                    if written == e.valB and exec_opcode in [opcodes.movrr, opcodes.addrr, opcodes.addmr, opcodes.submr]:
+                        log('E: Waiting register to be written back')
+                        self.top_stage = 4
+                        self.bottom_stage = 2
+                        self.finish_write_back = True
+                        break  # breaking to wait until write-back stage
+
+                    if written == e.valA and exec_opcode in [opcodes.movrr, opcodes.addrr, opcodes.addrm, opcodes.subrm, opcodes.subri, opcodes.subrr, opcodes.push]:
+                        log('E: Waiting register to be written back')
+                        self.top_stage = 4
+                        self.bottom_stage = 2
+                        self.finish_write_back = True
+                        break  # breaking to wait until write-back stage
+
+                    # Checking opcode type
+                    if exec_opcode == opcodes.movrr:
+                        log('E: movrr {}, {}'.format(e.valA, e.valB))  # Printing operation
+
+                        # Left operand becomes memory_address
+                        nm.valE = e.valA
+                        # From register address we get source register data and store it at valA of mem stage
+                        nm.valA = self.readReg(e.valB)
+
+                        # memory control value for sending from memory stage to write-back stage
+                        nm.control = 2
+                    elif exec_opcode == opcodes.movrm:
+                        # Getting value from valB address and send it to valA of mem stage
+                        nm.valA = self.readMem(e.valB)
+                        # sending destination register
+                        nm.valE = e.valA
+                        log('E: movrm {}, {}'.format(nm.valE, nm.valA))
+                        # Set up memory control for sending from memory stage to write-back stage
+                        nm.control = 2
+                    elif exec_opcode == opcodes.movmr:
+                        log('E: movmr {}, {}'.format(e.valA, e.valB))  # Printing instruction
+
+                        # sending memory_address to the memory stage
+                        nm.valE = e.valA
+                        nm.valA = self.readReg(e.valB)  # Getting value from source register
+                        nm.control = 1  # setting memory contol to write into memory
+                    elif exec_opcode == opcodes.movri:
+                        # Sending register address to memory stage
+                        nm.valE = e.valA
+                        # Sending immediate value to memory stage
+                        nm.valA = twos_components(e.valB)
+                        log('E: movri {}, {}'.format(nm.valE, nm.valA))
+                        nm.control = 2  # setting memory control for writting back
+
+                    elif exec_opcode in [opcodes.addrr, opcodes.addmr, opcodes.addrm, opcodes.addri, opcodes.subrr, opcodes.subri, opcodes.submr, opcodes.subrm]:
+                        left_operand = 0
+                        right_operand = 0
+                        sign = (exec_opcode & (1 << 2))
+
+                        if exec_opcode == opcodes.addrr or exec_opcode == opcodes.subrr:
+                            left_operand = twos_components(self.readReg(e.valA))
+                            right_operand = twos_components(self.readReg(e.valB))
+                            nm.control = 2
+                        elif exec_opcode == opcodes.addri or exec_opcode == opcodes.subri:
+                            left_operand = twos_components(self.readReg(e.valA))
+                            right_operand = e.valB
+                            nm.control = 2
+                        elif exec_opcode == opcodes.addrm or exec_opcode == opcodes.subrm:
+                            left_operand = twos_components(self.readReg(e.valA))
+                            right_operand = twos_components(self.readMem(e.valB))
+                            nm.control = 2
+                        elif exec_opcode == opcodes.addmr or exec_opcode == opcodes.addmr:
+                            left_operand = twos_components(self.readMem(e.valA))
+                            right_operand = twos_components(self.readReg(e.valB))
+                            nm.control = 1
+
+                        operation_result = None
+
+                        if sign:
+                            log('sub operation: {} {}'.format(
+                                left_operand, right_operand))
+                            operation_result = left_operand - right_operand
                         else:
-                            # Unknown instruction
-                            self.memory_registers['stat'] = 0b0001
-
-                    # Sending insformation about operation to the next stage
-                    self.memory_registers['stat'] = self.execute_registers['stat']
-                    self.memory_registers['icode'] = self.execute_registers['icode']
-                    self.memory_registers['dstM'] = self.execute_registers['dstM']
-                    self.memory_registers['dstE'] = self.execute_registers['dstE']
-                    self.stage_active[3] = True     # Activate next stage
-                    self.stage_active[2] = False    # Disable current stage
-                elif i == 1:
-                    """
-                        Decode stage
-                        By the time it just sent data to the execute stage
-                    """
-                    self.execute_registers['stat'] = self.decode_registers['stat']
-                    self.execute_registers['icode'] = self.decode_registers['icode']
-                    self.execute_registers['ifun'] = self.decode_registers['ifun']
-                    self.execute_registers['valA'] = self.decode_registers['rA']
-                    self.execute_registers['valB'] = self.decode_registers['rB']
-                    self.stage_active[2] = True     # Activate execute stage
-                    self.stage_active[1] = False    # Disable current stage
-                    complete_steps = "D" + complete_steps
-                elif i == 0:
-                    """
-                        Fetch stage
-                        Writting information about instruction to the decode stage
-                    """
-                    # Program counter prediction
-                    if opcode == opcodes.call:
-                        exec_opcode = self.execute_registers['icode'] * \
-                            8 + self.execute_registers['ifun']
-                        if self.stage_active[2] and (exec_opcode == opcodes.push or exec_opcode == opcodes.pop):
-                            break
-                        # If current fetched instruction is call instruction
-                        print('F: call PREDICTED')
-                        self.writeMem(self.readReg(7),
-                                      new_PC.to_bytes(4, 'little'))  # Writting new program counter to the stack
-                        print('Before call: {}'.format(new_PC))
-                        # Increase stack pointer
+                            log('add operation: {} {}'.format(
+                                left_operand, right_operand))
+                            operation_result = left_operand + right_operand
+
+                        # Flags are derived lazily from the stored operation
+                        self.alu_state = (
+                            sign, left_operand, right_operand, operation_result)
+
+                        nm.valE = e.valA
+                        log("Opetation result: {}".format(
+                            operation_result))
+                        nm.valA = twos_components(operation_result)
+
+                    elif exec_opcode == opcodes.push:
+                        log('Push from {}'.format(e.valA))
+                        nm.valE = self.readReg(7)
                         self.set_stack_pointer(self.readReg(7) + 4)
-                        print('CALL program counter: {}'.format(loper))
-                        self.PC = loper  # new program counter is now call address
-                        break
+                        nm.valA = self.readReg(e.valA)
+                        nm.control = 1
 
-                    elif opcode == opcodes.ret:
-                        # If current fetched instruction is ret instruction
-                        print('F: ret PREDICTED')
-                        # Decreasing stack pointer
+                    elif exec_opcode == opcodes.pop:
+                        log('POP to {}'.format(e.valA))
                         self.set_stack_pointer(self.readReg(7) - 4)
-                        # Getting value of program coutner from memory at stack pointer address
-                        self.PC = self.readMem(self.readReg(7), 4)
-                        print('RETURNED TO: {}'.format(self.PC))
+                        nm.valE = self.readReg(7)
+                        nm.valA = e.valA
+                        nm.control = 3
+
+                    elif exec_opcode == opcodes.halt:
+                        # Next operation are cancelled
+                        consumed[0], consumed[1], consumed[2] = True, True, True
+                        if rec is not None and d.active:
+                            rec.squash(d.serial)
+                        self.stop_computing = True  # to exit from loop
+                        log('E: halt')
+                        self.retired += 1
+                        self.top_stage = 4
+                        self.bottom_stage = 3  # Next stage will be only: write-back and memory to wait data to write into memory or registers
                         break
 
-                    elif opcode in [opcodes.jne, opcodes.je, opcodes.jnz, opcodes.jge, opcodes.jg, opcodes.jl, opcodes.jle]:
-                        # If current fetched instruction is conditional jump instrucion
-                        if not update_flag and (self.execute_registers['icode']*8 + self.execute_registers['ifun']) in [opcodes.addrr, opcodes.addmr, opcodes.addrm, opcodes.addri, opcodes.subri, opcodes.subrm, opcodes.submr, opcodes.subrr]:
-                            # waiting status flags to update
-                            update_flag = True
-                            break
-
-                        update_flag = False
-
-                        if opcode == opcodes.jnz:
-                            if not self.status_flags['ZF']:
-                                print('JNZ jump to {}'.format(loper))
-                                self.PC = loper
-                                break
-                        elif opcode == opcodes.je:
-                            if self.status_flags['ZF']:
-                                print('JE jump to {}'.format(loper))
-                                self.PC = loper
-                                break
-                        elif opcode == opcodes.jg:
-                            if not self.status_flags['SF'] and not self.status_flags['ZF']:
-                                print('JG jump to {}'.format(loper))
-                                self.PC = loper
-                                break
-                        elif opcode == opcodes.jl:
-                            if self.status_flags['SF'] and not self.status_flags['ZF']:
-                                print('JL jump to {}'.format(loper))
-                                self.PC = loper
-                                break
-                        elif opcode == opcodes.jge:
-                            print('SF: {}'.format(self.status_flags['SF']))
-                            if not self.status_flags['SF'] or self.status_flags['ZF']:
-                                print('JGE jump to {}'.format(loper))
-                                self.PC = loper
-                                break
-                        elif opcode == opcodes.jle:
-                            if self.status_flags['SF'] or self.status_flags['ZF']:
-                                print('JLE jump to {}'.format(loper))
-                                self.PC = loper
-                                break
-
-                    elif opcode == opcodes.jp:
-                        # If current fetched instruction is unconditional jump instruction
-                        print('F: JUMP PREDICTED')
-                        self.PC = loper  # Jump at address
+                    elif exec_opcode == opcodes.passop:
+                        # This instruction does nothing
+                        log('E: Instruction passoped')
+
+                # Sending insformation about operation to the next stage
+                nm.stat = e.stat
+                nm.serial = e.serial
+                nm.icode = e.icode
+                nm.dstM = e.dstM
+                nm.dstE = e.dstE
+                nm.active = True        # Activate next stage
+                consumed[2] = True      # Disable current stage
+            elif i == 1:
+                """
+                    Decode stage
+                    By the time it just sent data to the execute stage
+                """
+                if not d.active:
+                    continue
+                if rec is not None:
+                    rec.stage(d.serial, 1, cycle)
+                ne.stat = d.stat
+                ne.serial = d.serial
+                ne.icode = d.icode
+                ne.ifun = d.ifun
+                ne.valA = d.rA
+                ne.valB = d.rB
+                ne.active = True        # Activate execute stage
+                consumed[1] = True      # Disable current stage
+                if trace:
+                    complete_steps = "D" + complete_steps
+            elif i == 0:
+                """
+                    Fetch stage
+                    Writting information about instruction to the decode stage
+                """
+                # Instruction which is going to be at execute stage in the next cycle
+                upcoming = d if d.active else e
+                upcoming_opcode = upcoming.icode * 8 + upcoming.ifun
+
+                if self.fetch_serial is None:
+                    self.fetch_serial = self.fetched
+                    self.fetched += 1
+                    if rec is not None:
+                        rec.fetch(self.fetch_serial, self.PC, opcode)
+                if rec is not None:
+                    rec.stage(self.fetch_serial, 0, cycle)
+                fetch_done = True
+
+                # Program counter prediction
+                if opcode == opcodes.call:
+                    if d.active and (upcoming_opcode == opcodes.push or upcoming_opcode == opcodes.pop):
+                        fetch_done = False
                         break
+                    # If current fetched instruction is call instruction
+                    log('F: call PREDICTED')
+                    self.writeMem(self.readReg(7),
+                                  new_PC.to_bytes(4, 'little'))  # Writting new program counter to the stack
+                    log('Before call: {}'.format(new_PC))
+                    # Increase stack pointer
+                    self.set_stack_pointer(self.readReg(7) + 4)
+                    log('CALL program counter: {}'.format(loper))
+                    self.PC = loper  # new program counter is now call address
+                    self.retired += 1
+                    break
+
+                elif opcode == opcodes.ret:
+                    # If current fetched instruction is ret instruction
+                    log('F: ret PREDICTED')
+                    # Decreasing stack pointer
+                    self.set_stack_pointer(self.readReg(7) - 4)
+                    # Getting value of program coutner from memory at stack pointer address
+                    self.PC = self.readMem(self.readReg(7), 4)
+                    log('RETURNED TO: {}'.format(self.PC))
+                    self.retired += 1
+                    break
+
+                elif opcode in [opcodes.jne, opcodes.je, opcodes.jnz, opcodes.jge, opcodes.jg, opcodes.jl, opcodes.jle]:
+                    # If current fetched instruction is conditional jump instrucion
+                    if not self.update_flag and upcoming_opcode in [opcodes.addrr, opcodes.addmr, opcodes.addrm, opcodes.addri, opcodes.subri, opcodes.subrm, opcodes.submr, opcodes.subrr]:
+                        # waiting status flags to update
+                        self.update_flag = True
+                        fetch_done = False
+                        break
+
+                    self.update_flag = False
 
-                    self.decode_registers['stat'] == 0b0000
-                    self.decode_registers['icode'] = opcode >> 3
-                    self.decode_registers['ifun'] = opcode & 0b111
-                    self.decode_registers['rA'] = loper
-                    self.decode_registers['rB'] = roper
+                    if opcode == opcodes.jnz or opcode == opcodes.jne:
+                        if not self.get_flag('ZF'):
+                            log('JNZ/JNE jump to {}'.format(loper))
+                            self.PC = loper
+                            self.retired += 1
+                            break
+                    elif opcode == opcodes.je:
+                        if self.get_flag('ZF'):
+                            log('JE jump to {}'.format(loper))
+                            self.PC = loper
+                            self.retired += 1
+                            break
+                    elif opcode == opcodes.jg:
+                        if not self.get_flag('SF') and not self.get_flag('ZF'):
+                            log('JG jump to {}'.format(loper))
+                            self.PC = loper
+                            self.retired += 1
+                            break
+                    elif opcode == opcodes.jl:
+                        if self.get_flag('SF') and not self.get_flag('ZF'):
+                            log('JL jump to {}'.format(loper))
+                            self.PC = loper
+                            self.retired += 1
+                            break
+                    elif opcode == opcodes.jge:
+                        log('SF: {}'.format(self.get_flag('SF')))
+                        if not self.get_flag('SF') or self.get_flag('ZF'):
+                            log('JGE jump to {}'.format(loper))
+                            self.PC = loper
+                            self.retired += 1
+                            break
+                    elif opcode == opcodes.jle:
+                        if self.get_flag('SF') or self.get_flag('ZF'):
+                            log('JLE jump to {}'.format(loper))
+                            self.PC = loper
+                            self.retired += 1
+                            break
+
+                elif opcode == opcodes.jp:
+                    # If current fetched instruction is unconditional jump instruction
+                    log('F: JUMP PREDICTED')
+                    self.PC = loper  # Jump at address
+                    self.retired += 1
+                    break
+
+                nd.stat = 0b0000
+                nd.serial = self.fetch_serial
+                nd.icode = opcode >> 3
+                nd.ifun = opcode & 0b111
+                nd.rA = loper
+                nd.rB = roper
+                nd.active = True        # Activate Decode stage
+                if trace:
                     complete_steps = "F" + complete_steps
 
-                    self.PC = new_PC  # Setting up new program counter
-                    self.stage_active[1] = True     # Activate Decode stage
-                    self.stage_active[0] = False    # Disable current stage
-            if stop_computing:
-                # if stop_computing == true
-                # We need to wait to data be stored at registers or momory
-                # It will take a maximum of 2 cycles
-                finish_prev -= 1
-            print(complete_steps)  # Print completed stages
-            sleep(0.2)
+                self.PC = new_PC  # Setting up new program counter
+        if fetch_done:
+            self.fetch_serial = None
+        self.commit_latches(consumed)
+        if self.stop_computing:
+            # if self.stop_computing == true
+            # We need to wait to data be stored at registers or momory
+            # It will take a maximum of 2 cycles
+            self.finish_prev -= 1
+        log(complete_steps)  # Print completed stages
+        if self.delay:
+            import time
+            time.sleep(self.delay)
+        self.cycles += 1
+
+    def record_pipeline(self, capacity: int = 4096):
+        """
+            Function for recording stage occupancy of the last capacity instructions
+            def record_pipeline(self, capacity: int = 4096) -> pipeview.PipelineRecorder
+        """
+        from pipeview import PipelineRecorder
+        self.recorder = PipelineRecorder(capacity, opcode_names)
+        return self.recorder
+
+    def commit_latches(self, consumed: list[bool]) -> None:
+        """
+            Function for making next stage registers current
+            def commit_latches(self, consumed: list[bool]) -> None
+
+            Written next registers replace current ones, processed current registers
+            without a new instruction become empty, the rest keep their instruction.
+        """
+        if self.next_decode_registers.active:
+            self.decode_registers, self.next_decode_registers = self.next_decode_registers, self.decode_registers
+        elif consumed[1]:
+            self.decode_registers.active = False
+        if self.next_execute_registers.active:
+            self.execute_registers, self.next_execute_registers = self.next_execute_registers, self.execute_registers
+        elif consumed[2]:
+            self.execute_registers.active = False
+        if self.next_memory_registers.active:
+            self.memory_registers, self.next_memory_registers = self.next_memory_registers, self.memory_registers
+        elif consumed[3]:
+            self.memory_registers.active = False
+        if self.next_write_back_registers.active:
+            self.write_back_registers, self.next_write_back_registers = self.next_write_back_registers, self.write_back_registers
+        elif consumed[4]:
+            self.write_back_registers.active = False
+
+    def get_flag(self, name: str) -> int:
+        """
+            Function for reading a status flag
+            def get_flag(self, name: str) -> int
+
+            ZF, SF, OF and CF are computed from the last ALU operation on first request
+            and memoized until the next ALU operation replaces alu_state.
+        """
+        if name in self.control_flags:
+            return self.control_flags[name]
+        if self.flags_cache is not self.alu_state:
+            self.flags_cached = alu_flags(*self.alu_state)
+            self.flags_cache = self.alu_state
+        return self.flags_cached[name]
+
+    @property
+    def status_flags(self) -> dict[str, int]:
+        """
+            Status flags for last operation (read only view for inspectors)
+        """
+        flags = dict(self.control_flags)
+        for name in ['CF', 'ZF', 'SF', 'OF']:
+            flags[name] = self.get_flag(name)
+        return flags
 
     def set_pc(self, pc_val):
         """
@@ -617,14 +864,134 @@ class SEQ(object):
         print('System memory size: {} bytes'.format(self.memsize))
 
 
-def main():
-    seq = SEQ(32, 1024)
-    asm_parser('exec.asm', seq)
-    seq.set_stack_pointer(200)
-    seq.memDump()
-    seq.compute()
-    seq.memDump()
+def run_fast(seq: SEQ, fuse: bool, max_instructions: int | None = None, deadline: float | None = None, hot_threshold: int | None = HOT_THRESHOLD) -> tuple[str, int]:
+    """
+        Function for running program loaded into seq with engine.FastEngine
+        def run_fast(seq: SEQ, fuse: bool, max_instructions: int | None = None, deadline: float | None = None, hot_threshold: int | None = HOT_THRESHOLD) -> tuple[str, int]
+
+        hot_threshold - back edges before a loop becomes superblock, 0 or None disables
+                        superblocks.
+        Returns status (as SEQ.compute()) and number of executed instructions.
+    """
+    from engine import FastEngine
+    fast = FastEngine(seq, fuse, hot_threshold)
+    if deadline is None:
+        return fast.run(max_instructions), fast.instructions
+    import time
+    while time.monotonic() < deadline:
+        budget = 10000  # instructions between deadline checks
+        if max_instructions is not None:
+            budget = min(budget, max_instructions - fast.instructions)
+        status = fast.run(budget)
+        if status != 'max_instructions' or fast.instructions == max_instructions:
+            return status, fast.instructions
+    return 'deadline', fast.instructions
+
+
+def main(argv: list[str] | None = None) -> int:
+    import argparse
+    parser = argparse.ArgumentParser(description='SEQ simulator')
+    parser.add_argument('program', nargs='?', default='exec.asm',
+                        help='.asm file to assemble and run')
+    parser.add_argument('--bits', type=int, default=32)
+    parser.add_argument('--memory', type=int, default=1024,
+                        help='memory size in bytes')
+    parser.add_argument('--sp', type=lambda value: int(value, 0), default=200,
+                        help='initial stack pointer')
+    parser.add_argument('--engine', choices=['pipeline', 'fast', 'fused'], default='pipeline',
+                        help='pipeline - cycle accurate, fast/fused - instruction level')
+    parser.add_argument('--trace', action='store_true',
+                        help='print stages of every pipeline cycle')
+    parser.add_argument('--delay', type=float, default=0,
+                        help='pause after every traced cycle (seconds)')
+    parser.add_argument('--max-cycles', type=int,
+                        help='pipeline engine only')
+    parser.add_argument('--max-instructions', type=int)
+    parser.add_argument('--hot-threshold', type=int, default=HOT_THRESHOLD,
+                        help='back edges before a loop is compiled into a superblock '
+                        '(fast/fused engines, 0 disables)')
+    parser.add_argument('--timeout', type=float, help='seconds')
+    parser.add_argument('--pipeview', metavar='FILE',
+                        help='write pipeline diagram (.csv, .html or text, - for stdout)')
+    parser.add_argument('--window', metavar='START:END',
+                        help='cycles shown in pipeline diagram')
+    parser.add_argument('--console', type=lambda value: int(value, 0), metavar='ADDRESS',
+                        help='map console device (stdout) at address')
+    parser.add_argument('--timer', type=lambda value: int(value, 0), metavar='ADDRESS',
+                        help='map timer device (microseconds) at address')
+    parser.add_argument('--disk', nargs=2, metavar=('FILE', 'ADDRESS'),
+                        help='map block device backed by FILE at ADDRESS')
+    parser.add_argument('--verbose', action='store_true',
+                        help='print assembler output')
+    parser.add_argument('--dump', action='store_true',
+                        help='print registers and memory before and after computing')
+    args = parser.parse_args(argv)
+    if args.hot_threshold < 0:
+        parser.error('--hot-threshold must not be negative')
+    if args.engine != 'pipeline' and args.max_cycles is not None:
+        parser.error('--max-cycles needs --engine pipeline')
+    if args.engine != 'pipeline' and args.pipeview:
+        parser.error('--pipeview needs --engine pipeline')
+    if args.window is not None and not args.pipeview:
+        parser.error('--window needs --pipeview')
+    start = end = None  # cycles shown in pipeline diagram
+    if args.window is not None:
+        try:
+            start, end = [int(value) if value else None
+                          for value in args.window.split(':')]
+        except ValueError:
+            parser.error('--window must be START:END: {}'.format(args.window))
+    import os
+    if not os.path.isfile(args.program):
+        parser.error('Program file not found: {}'.format(args.program))
+
+    from asm_parser import asm_parser
+    seq = SEQ(args.bits, args.memory)
+    seq.trace = args.trace
+    seq.delay = args.delay if args.trace else 0
+    if args.pipeview:
+        seq.record_pipeline()
+    if args.console is not None or args.timer is not None or args.disk:
+        import devices
+        if args.console is not None:
+            seq.add_device(args.console, devices.Console())
+        if args.timer is not None:
+            seq.add_device(args.timer, devices.Timer())
+        if args.disk:
+            seq.add_device(int(args.disk[1], 0),
+                           devices.BlockDevice(args.disk[0]))
+    asm_parser(args.program, seq, args.verbose)
+    seq.set_stack_pointer(args.sp)
+    if args.dump:
+        seq.memDump()
+
+    deadline = None
+    if args.timeout is not None:
+        import time
+        deadline = time.monotonic() + args.timeout
+    if args.engine == 'pipeline':
+        status = seq.compute(args.max_cycles, args.max_instructions, deadline)
+        print('{}: {} cycles, {} instructions'.format(
+            status, seq.cycles, seq.retired))
+    else:
+        status, instructions = run_fast(
+            seq, args.engine == 'fused', args.max_instructions, deadline, args.hot_threshold)
+        print('{}: {} instructions'.format(status, instructions))
+
+    if seq.recorder is not None:
+        if args.pipeview == '-':
+            print(seq.recorder.text(start, end), end='')
+        else:
+            seq.recorder.export(args.pipeview, start, end)
+
+    if args.dump:
+        seq.memDump()
+    else:
+        for name in list(regfile.keys())[:8]:
+            print('{:<6}\t{:#010x}'.format(name, seq.readReg(regfile[name])))
+    print('PC    \t{:#06x}'.format(seq.PC))
+    return 0 if status == 'halted' else 1
 
 
 if __name__ == "__main__":
-    main()
+    raise SystemExit(main())
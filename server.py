@@ -0,0 +1,275 @@
+import asyncio
+import argparse
+import itertools
+import json
+from asm_parser import IncrementalAssembler, assemble
+from engine import FastEngine
+from seq import SEQ
+from utils import regfile
+
+SLICE = 20000  # instructions executed by one session before yielding to others
+MAX_RUN = 10000000  # default and maximum instructions of one run command
+MAX_MEMORY = 1 << 20  # maximum memory of one session (bytes)
+MAX_SESSIONS = 64
+LINE_LIMIT = 16 << 20  # maximum length of one request line (bytes)
+
+
+class Session(object):
+    """
+        One simulated computer hosted by the server
+    """
+
+    def __init__(self, session_id: int, bits: int, memory: int) -> None:
+        self.id: int = session_id
+        self.computer: SEQ = SEQ(bits, memory)
+        self.engine: FastEngine = FastEngine(self.computer)
+        self.breakpoints: set[int] = set()
+        self.assembler: IncrementalAssembler = IncrementalAssembler()
+        self.lock = asyncio.Lock()  # one command of session is served at a time
+        self.closing: bool = False  # close was requested, running command stops
+
+    def reset_engine(self) -> None:
+        """
+            Function for dropping decoded program after memory was rewritten
+        """
+        self.engine = FastEngine(self.computer)
+
+
+class SimulationServer(object):
+    """
+        Asyncio server hosting many SEQ sessions over newline separated JSON.
+
+        Request:  {"id": 1, "cmd": "run", "session": 3, "max_instructions": 1000}
+        Response: {"id": 1, "ok": true, ...} or {"id": 1, "ok": false, "error": "..."}
+
+        Commands:
+            create      bits, memory                -> session
+            assemble    session, source             -> objdump, pc (loads program)
+            patch       session, source, [set_pc]   -> ranges, encoded, reused, pc
+                                                       (rewrites only changed code)
+            load        session, address, data(hex)    (raw bytes into memory)
+            set_sp      session, value
+            set_pc      session, value
+            break       session, address, [remove]  -> breakpoints
+            run         session, [max_instructions] -> status, instructions, pc
+                                                       (status 'stopped' after close or
+                                                       disconnect of the client)
+            regs        session                     -> registers, flags, pc
+            mem         session, address, length    -> data(hex)
+            close       session
+
+        Requests of one connection are served concurrently, responses of different
+        sessions may come in any order and are matched by id. A run is limited to
+        max_run instructions, it is also the default budget. create is rejected when
+        memory exceeds max_memory or max_sessions sessions exist, request lines are
+        limited to line_limit bytes.
+    """
+
+    def __init__(self, slice_size: int = SLICE, max_run: int = MAX_RUN, max_memory: int = MAX_MEMORY, max_sessions: int = MAX_SESSIONS, line_limit: int = LINE_LIMIT) -> None:
+        self.sessions: dict[int, Session] = {}
+        self.ids = itertools.count(1)
+        self.slice_size: int = slice_size
+        self.max_run: int = max_run
+        self.max_memory: int = max_memory
+        self.max_sessions: int = max_sessions
+        self.line_limit: int = line_limit
+
+    def get_session(self, request: dict) -> Session:
+        session = self.sessions.get(request.get('session'))
+        if session is None:
+            raise Exception('Unknown session: {}'.format(
+                request.get('session')))
+        return session
+
+    async def handle(self, request: dict, disconnected: asyncio.Event | None = None) -> dict:
+        """
+            Function for executing one request
+            async def handle(self, request: dict, disconnected: asyncio.Event | None = None) -> dict
+
+            disconnected - set when client of the request is gone, running command stops
+        """
+        cmd = request.get('cmd')
+        if cmd == 'create':
+            memory = request.get('memory', 1024)
+            if type(memory) != int or not 0 < memory <= self.max_memory:
+                raise Exception('Memory must be 1 to {} bytes: {}'.format(
+                    self.max_memory, memory))
+            if len(self.sessions) >= self.max_sessions:
+                raise Exception('Too many sessions: {}'.format(
+                    len(self.sessions)))
+            session = Session(next(self.ids), request.get('bits', 32), memory)
+            self.sessions[session.id] = session
+            return {'session': session.id}
+        handler = getattr(self, 'cmd_' + str(cmd), None)
+        if handler is None:
+            raise Exception('Unknown command: {}'.format(cmd))
+        session = self.get_session(request)
+        if cmd == 'close':
+            session.closing = True  # do not wait for the end of a running program
+        async with session.lock:
+            if cmd == 'run':
+                return await handler(session, request, disconnected)
+            return await handler(session, request)
+
+    async def cmd_assemble(self, session: Session, request: dict) -> dict:
+        # assemble() keeps labels in module globals, it must not be interleaved
+        objdump = assemble(request['source'], session.computer, verbose=False)
+        session.reset_engine()
+        session.assembler.seed(request['source'])  # later patches are diffed against it
+        return {'objdump': objdump, 'pc': session.computer.PC}
+
+    async def cmd_patch(self, session: Session, request: dict) -> dict:
+        # program is kept running, only decoded entries of patched ranges are dropped
+        ranges = session.assembler.load(
+            request['source'], session.computer, request.get('set_pc', False))
+        for start, end in ranges:
+            session.engine.invalidate(start, end)
+        return {'ranges': ranges, 'encoded': session.assembler.encoded,
+                'reused': session.assembler.reused, 'pc': session.computer.PC}
+
+    async def cmd_load(self, session: Session, request: dict) -> dict:
+        session.computer.writeMem(
+            request['address'], bytes.fromhex(request['data']))
+        session.reset_engine()
+        return {}
+
+    async def cmd_set_sp(self, session: Session, request: dict) -> dict:
+        session.computer.set_stack_pointer(request['value'])
+        return {}
+
+    async def cmd_set_pc(self, session: Session, request: dict) -> dict:
+        session.computer.set_pc(request['value'])
+        session.engine.halted = False
+        return {}
+
+    async def cmd_break(self, session: Session, request: dict) -> dict:
+        if request.get('remove'):
+            session.breakpoints.discard(request['address'])
+        else:
+            session.breakpoints.add(request['address'])
+        return {'breakpoints': sorted(session.breakpoints)}
+
+    async def cmd_run(self, session: Session, request: dict, disconnected: asyncio.Event | None = None) -> dict:
+        """
+            Program is executed in slices in the default executor, so a long run of one
+            session does not block requests of other sessions. Close of the session and
+            disconnect of the client are checked between slices.
+        """
+        loop = asyncio.get_running_loop()
+        budget = min(request.get('max_instructions', self.max_run), self.max_run)
+        engine = session.engine
+        start = engine.instructions
+        status = 'max_instructions'
+        while engine.instructions - start < budget:
+            if session.closing or (disconnected is not None and disconnected.is_set()):
+                status = 'stopped'
+                break
+            size = min(self.slice_size, budget - (engine.instructions - start))
+            status = await loop.run_in_executor(
+                None, engine.run, size, set(session.breakpoints))
+            if status != 'max_instructions':
+                break
+        return {'status': status, 'instructions': engine.instructions - start, 'pc': session.computer.PC}
+
+    async def cmd_regs(self, session: Session, request: dict) -> dict:
+        computer = session.computer
+        return {
+            'registers': {name: computer.readReg(reg) for name, reg in regfile.items()},
+            'flags': computer.status_flags,
+            'pc': computer.PC,
+        }
+
+    async def cmd_mem(self, session: Session, request: dict) -> dict:
+        data = session.computer.memory[request['address']:
+                                       request['address'] + request['length']]
+        return {'data': bytes(data).hex()}
+
+    async def cmd_close(self, session: Session, request: dict) -> dict:
+        del self.sessions[session.id]
+        return {}
+
+    async def serve_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """
+            Function for serving one connection, each line is one JSON request
+
+            Requests are served in their own tasks, so end of the connection is noticed
+            while a program runs and stops it.
+        """
+        disconnected = asyncio.Event()
+        write_lock = asyncio.Lock()
+        tasks = set()
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (ValueError, asyncio.LimitOverrunError):  # line over the limit, stream can't be resynchronised
+                    await self.reply(writer, write_lock, {'ok': False, 'error': 'Request longer than {} bytes'.format(
+                        self.line_limit)})
+                    break
+                if not line:
+                    break
+                task = asyncio.create_task(self.respond(
+                    line, writer, write_lock, disconnected))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        finally:
+            disconnected.set()
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+            writer.close()
+
+    async def respond(self, line: bytes, writer: asyncio.StreamWriter, write_lock: asyncio.Lock, disconnected: asyncio.Event) -> None:
+        """
+            Function for executing one request line and writing its response
+        """
+        request = {}
+        try:
+            request = json.loads(line)
+            response = await self.handle(request, disconnected)
+            response['ok'] = True
+        except Exception as error:
+            response = {'ok': False, 'error': str(error)}
+        if isinstance(request, dict) and 'id' in request:
+            response['id'] = request['id']
+        if disconnected.is_set():
+            return
+        await self.reply(writer, write_lock, response)
+
+    async def reply(self, writer: asyncio.StreamWriter, write_lock: asyncio.Lock, response: dict) -> None:
+        async with write_lock:
+            writer.write((json.dumps(response) + '\n').encode())
+            await writer.drain()
+
+    async def serve(self, host: str = '127.0.0.1', port: int = 8765, unix: str | None = None) -> None:
+        """
+            Function for listening on TCP host:port or on unix socket path
+        """
+        if unix is not None:
+            server = await asyncio.start_unix_server(self.serve_client, unix, limit=self.line_limit)
+        else:
+            server = await asyncio.start_server(self.serve_client, host, port, limit=self.line_limit)
+        async with server:
+            await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='SEQ simulation server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', default=None, help='unix socket path')
+    parser.add_argument('--slice', type=int, default=SLICE,
+                        help='instructions per time slice')
+    parser.add_argument('--max-run', type=int, default=MAX_RUN,
+                        help='default and maximum instructions of one run command')
+    parser.add_argument('--max-memory', type=int, default=MAX_MEMORY,
+                        help='maximum memory of one session (bytes)')
+    parser.add_argument('--max-sessions', type=int, default=MAX_SESSIONS)
+    parser.add_argument('--line-limit', type=int, default=LINE_LIMIT,
+                        help='maximum length of one request (bytes)')
+    args = parser.parse_args()
+    asyncio.run(SimulationServer(args.slice, args.max_run, args.max_memory, args.max_sessions, args.line_limit).serve(
+        args.host, args.port, args.unix))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+import gc
+import multiprocessing
+import queue
+import time
+from multiprocessing import shared_memory
+from asm_parser import assemble
+from engine import FastEngine
+from seq import SEQ
+from utils import regfile
+
+# Pipeline control state of SEQ transferred together with latches
+PIPELINE_STATE = ['stop_computing', 'finish_prev', 'top_stage', 'bottom_stage', 'finish_write_back',
+                  'update_flag', 'fetched', 'fetch_serial', 'cycles', 'retired']
+LATCHES = ['decode_registers', 'execute_registers',
+           'memory_registers', 'write_back_registers']
+
+
+class System(object):
+    """
+        Several SEQ cores sharing one guest memory.
+
+        Every core has its own register file, program counter and pipeline latches.
+        run() interleaves cores with a deterministic round-robin scheduler: each core
+        in turn gets a quantum (cycles for 'pipeline' engine, instructions for 'fast'
+        engine) until all cores halt.
+    """
+
+    def __init__(self, cores: int, memory: int, bits: int = 32, engine: str = 'pipeline', quantum: int = 100, memory_buffer=None) -> None:
+        if engine not in ['pipeline', 'fast']:
+            raise Exception('Unknown engine: {}'.format(engine))
+        self.bits: int = bits
+        self.memsize: int = memory
+        if memory_buffer is None:
+            memory_buffer = bytearray(memory)
+        self.memory = memory_buffer  # guest memory shared by all cores
+        self.engine: str = engine
+        self.quantum: int = quantum
+        self.cores: list[SEQ] = [SEQ(bits, memory, self.memory)
+                                 for _ in range(cores)]
+        self.engines: list[FastEngine | None] = [None]*cores
+        if engine == 'fast':
+            self.engines = [FastEngine(core) for core in self.cores]
+        self.rounds = 0  # number of scheduler rounds
+
+    def load(self, source: str, id_register: str | None = None, verbose: bool = False) -> None:
+        """
+            Function for assembling program into shared memory
+            def load(self, source: str, id_register: str | None = None, verbose: bool = False) -> None
+
+            All cores start at program entry point. If id_register is given (e.g. 'esi'),
+            index of the core is written into it so cores can split work.
+        """
+        assemble(source, self.cores[0], verbose)
+        for i, core in enumerate(self.cores):
+            core.set_pc(self.cores[0].PC)
+            if id_register is not None:
+                core.writeReg(regfile[id_register], i.to_bytes(4, 'little'))
+        for engine in self.engines:
+            if engine is not None:
+                engine.invalidate()
+
+    def set_stack_pointer(self, core: int, pointer: int) -> None:
+        """
+            Function for setting stack pointer of one core
+        """
+        self.cores[core].set_stack_pointer(pointer)
+
+    def halted(self, core: int) -> bool:
+        """
+            Function for checking if core executed halt
+        """
+        if self.engines[core] is not None:
+            return self.engines[core].halted
+        return self.cores[core].halted
+
+    def step(self, core: int) -> str:
+        """
+            Function for running one quantum on core
+            def step(self, core: int) -> str
+        """
+        if self.engines[core] is not None:
+            return self.engines[core].run(self.quantum)
+        return self.cores[core].compute(max_cycles=self.quantum)
+
+    def run(self, max_rounds: int | None = None) -> bool:
+        """
+            Function for interleaving cores until all of them halt
+            def run(self, max_rounds: int | None = None) -> bool
+
+            Returns True when all cores halted, False when max_rounds was reached.
+        """
+        rounds = 0
+        while True:
+            running = [i for i in range(len(self.cores)) if not self.halted(i)]
+            if not running:
+                return True
+            if max_rounds is not None and rounds >= max_rounds:
+                return False
+            for i in running:
+                self.step(i)
+            rounds += 1
+            self.rounds += 1
+
+    def run_parallel(self, groups: list[list[int]], max_rounds: int | None = None, timeout: float | None = None) -> bool:
+        """
+            Function for running groups of cores in separate host processes
+            def run_parallel(self, groups: list[list[int]], max_rounds: int | None = None, timeout: float | None = None) -> bool
+
+            Guest memory is moved into multiprocessing.shared_memory, every group is
+            interleaved by its own round-robin scheduler until its cores halt or
+            max_rounds rounds were run. Order of memory accesses between groups is not
+            deterministic. Cores continue from their registers, program counter and
+            (for 'pipeline' engine) pipeline latches, in both directions.
+            An error in a group process or timeout (seconds) raises Exception.
+            Returns True when all cores halted.
+        """
+        deadline = None
+        if timeout is not None:
+            deadline = time.monotonic() + timeout
+        shm = shared_memory.SharedMemory(create=True, size=self.memsize)
+        processes = []
+        try:
+            shm.buf[:self.memsize] = self.memory[:self.memsize]
+            results = multiprocessing.Queue()
+            for n, group in enumerate(groups):
+                states = [core_state(self.cores[i], self.halted(i), self.engine == 'pipeline')
+                          for i in group]
+                process = multiprocessing.Process(target=run_group, args=(
+                    n, shm.name, self.memsize, self.bits, self.engine, self.quantum, states, results, max_rounds))
+                process.start()
+                processes.append(process)
+            finished = {}
+            while len(finished) < len(processes):
+                try:
+                    n, states = results.get(timeout=0.1)
+                except queue.Empty:
+                    if deadline is not None and time.monotonic() >= deadline:
+                        raise Exception(
+                            'Parallel run timed out after {} seconds'.format(timeout))
+                    for n, process in enumerate(processes):
+                        if n not in finished and process.exitcode is not None and results.empty():
+                            raise Exception('Group {} process exited with code {} without result'.format(
+                                n, process.exitcode))
+                    continue
+                if isinstance(states, str):
+                    raise Exception('Group {} failed: {}'.format(n, states))
+                finished[n] = states
+            for process in processes:
+                process.join()
+            for n, group in enumerate(groups):
+                for i, state in zip(group, finished[n]):
+                    restore_core(self.cores[i], self.engines[i], state)
+            self.memory[:self.memsize] = shm.buf[:self.memsize]
+        finally:
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+                process.join()
+            shm.close()
+            shm.unlink()
+        return all(self.halted(i) for i in range(len(self.cores)))
+
+
+def core_state(core: SEQ, halted: bool, pipeline: bool = False) -> tuple:
+    """
+        Function for getting state of core: (registers, PC, alu_state, halted, pipeline)
+
+        pipeline - control state and latch contents when pipeline is True, otherwise None
+    """
+    pipeline_state = None
+    if pipeline:
+        pipeline_state = ({name: getattr(core, name) for name in PIPELINE_STATE},
+                          [getattr(core, name).as_dict() for name in LATCHES])
+    return (bytes(core.registers), core.PC, core.alu_state, halted, pipeline_state)
+
+
+def restore_core(core: SEQ, engine: FastEngine | None, state: tuple) -> None:
+    """
+        Function for loading state made by core_state() into core
+    """
+    registers, pc, alu_state, halted, pipeline_state = state
+    core.registers[:] = registers
+    core.set_pc(pc)
+    core.alu_state = alu_state
+    if engine is not None:
+        engine.halted = halted
+    elif pipeline_state is not None:
+        control, latches = pipeline_state
+        for name, value in control.items():
+            setattr(core, name, value)
+        for name, fields in zip(LATCHES, latches):
+            latch = getattr(core, name)
+            for field, value in fields.items():
+                setattr(latch, field, value)
+    elif halted:
+        core.stop_computing = True
+        core.finish_prev = 0
+
+
+def run_group(n: int, shm_name: str, memsize: int, bits: int, engine: str, quantum: int, states: list[tuple], results, max_rounds: int | None = None) -> None:
+    """
+        Function executed in a host process for one group of cores
+
+        Puts (n, core states) into results, or (n, error text) when running failed.
+    """
+    shm = shared_memory.SharedMemory(name=shm_name)
+    view = shm.buf[:memsize]
+    system = None
+    try:
+        system = System(len(states), memsize, bits, engine, quantum, view)
+        for i, state in enumerate(states):
+            restore_core(system.cores[i], system.engines[i], state)
+        system.run(max_rounds)
+        results.put((n, [core_state(core, system.halted(i), engine == 'pipeline')
+                    for i, core in enumerate(system.cores)]))
+    except Exception as error:
+        results.put((n, '{}: {}'.format(type(error).__name__, error)))
+    finally:
+        system = None
+        gc.collect()  # engines keep reference cycles holding the shared buffer
+        view.release()
+        shm.close()
@@ -0,0 +1,31 @@
+from analysis import ControlFlowGraph
+from asm_parser import assemble
+from seq import SEQ
+
+
+def graph(source: str) -> ControlFlowGraph:
+    computer = SEQ(32, 1024)
+    assemble(source, computer, verbose=False)
+    return ControlFlowGraph(computer)
+
+
+def test_code_after_jump_is_unreachable():
+    cfg = graph('.text\n<main:0x0000>\nmovri eax, 0x1\njp E\nmovri esi, 0x1\n'
+                'addri esi, 0x1\n.E\nhalt\n')
+    assert sorted(cfg.blocks) == [0x0, 0xc, 0x18]
+    assert cfg.unreachable == [0xc]
+    assert [i.address for i in cfg.blocks[0xc].instructions] == [0xc, 0x12]
+    assert cfg.problems == []
+
+
+def test_code_after_halt_and_ret_is_unreachable():
+    cfg = graph('.text\n<main:0x0000>\ncall 0x100\nhalt\nmovri eax, 0x1\n'
+                '<f:0x100>\nret\naddri eax, 0x1\n')
+    assert cfg.unreachable == [0xc, 0x106]
+
+
+def test_loop_without_dead_code():
+    cfg = graph('.text\n<main:0x0000>\nmovri ecx, 0x3\n.L1\nsubri ecx, 0x1\n'
+                'jg L1\nhalt\n')
+    assert cfg.unreachable == []
+    assert cfg.loop_heads == {0x6}
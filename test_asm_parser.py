@@ -0,0 +1,72 @@
+from asm_parser import IncrementalAssembler, assemble
+from seq import SEQ
+
+VERSIONS = [
+    # first load
+    '.text\n<main:0x0000>\nmovri ecx, 0x3\n.L1\naddri eax, 0x2\nsubri ecx, 0x1\n'
+    'jg L1\ncall 0x100\nhalt\n<f:0x100>\nmovri ebx, 0x5\nret\n',
+    # immediate changed in main
+    '.text\n<main:0x0000>\nmovri ecx, 0x4\n.L1\naddri eax, 0x2\nsubri ecx, 0x1\n'
+    'jg L1\ncall 0x100\nhalt\n<f:0x100>\nmovri ebx, 0x5\nret\n',
+    # instruction added to the function only
+    '.text\n<main:0x0000>\nmovri ecx, 0x4\n.L1\naddri eax, 0x2\nsubri ecx, 0x1\n'
+    'jg L1\ncall 0x100\nhalt\n<f:0x100>\nmovri ebx, 0x5\naddri ebx, 0x1\nret\n',
+    # instruction inserted before the loop, label moves
+    '.text\n<main:0x0000>\nmovri ecx, 0x4\nmovri edx, 0x1\n.L1\naddri eax, 0x2\n'
+    'subri ecx, 0x1\njg L1\ncall 0x100\nhalt\n<f:0x100>\nmovri ebx, 0x5\naddri ebx, 0x1\nret\n',
+    # function removed, main shrinks
+    '.text\n<main:0x0000>\nmovri ecx, 0x4\n.L1\nsubri ecx, 0x1\njg L1\nhalt\n',
+]
+
+
+def assembled(source: str) -> tuple[bytes, int]:
+    computer = SEQ(32, 1024)
+    assemble(source, computer, verbose=False)
+    return bytes(computer.memory), computer.PC
+
+
+def test_load_matches_assemble_across_edits():
+    computer = SEQ(32, 1024)
+    assembler = IncrementalAssembler()
+    for source in VERSIONS:
+        assembler.load(source, computer)
+        assert (bytes(computer.memory), computer.PC) == assembled(source)
+
+
+def test_load_patches_only_changed_bytes():
+    computer = SEQ(32, 1024)
+    assembler = IncrementalAssembler()
+    assembler.load(VERSIONS[0], computer)
+    assert assembler.load(VERSIONS[1], computer) == [(0x2, 0x3)]
+    assert (assembler.encoded, assembler.reused) == (1, 1)
+    ranges = assembler.load(VERSIONS[2], computer)
+    assert all(0x100 <= start and end <= 0x112 for start, end in ranges)
+    assert (assembler.encoded, assembler.reused) == (1, 1)
+
+
+def test_load_keeps_pc_of_running_program():
+    computer = SEQ(32, 1024)
+    assembler = IncrementalAssembler()
+    assembler.load(VERSIONS[0], computer)
+    computer.set_pc(0x12)
+    assembler.load(VERSIONS[1], computer)
+    assert computer.PC == 0x12
+    assembler.load(VERSIONS[1], computer, set_pc=True)
+    assert computer.PC == 0x0
+
+
+def test_seed_after_assemble():
+    computer = SEQ(32, 1024)
+    assemble(VERSIONS[0], computer, verbose=False)
+    assembler = IncrementalAssembler()
+    assembler.seed(VERSIONS[0])
+    computer.set_pc(0x12)
+    assert assembler.load(VERSIONS[1], computer) == [(0x2, 0x3)]
+    assert computer.PC == 0x12
+
+
+def test_cache_keeps_only_current_sections():
+    assembler = IncrementalAssembler()
+    for source in VERSIONS:
+        assembler.assemble(source)
+    assert len(assembler.cache) == 1
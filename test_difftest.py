@@ -0,0 +1,18 @@
+import difftest
+
+
+def test_stepping_engines_agree():
+    assert difftest.fuzz(40, seed=0, engines=['fast', 'fused', 'hot']) == []
+
+
+def test_stepping_engines_agree_without_calls_and_stack():
+    assert difftest.fuzz(20, seed=1000, engines=['fast', 'fused', 'hot'],
+                         calls=False, stack=False) == []
+
+
+def test_random_programs_halt():
+    for n in range(40):
+        source = difftest.random_program(difftest.random.Random(n), full=True)
+        run = difftest.Run('fast', source, 1024, 0x200)
+        run.finish(10000)
+        assert run.error is None and run.halted, n
@@ -0,0 +1,57 @@
+import pytest
+from devices import Device
+from seq import SEQ
+
+
+class Register(Device):
+    size = 8
+
+    def __init__(self) -> None:
+        self.written = []
+
+    def read(self, offset: int, num_of_bytes: int) -> int:
+        return 0x100 + offset
+
+    def write(self, offset: int, data: bytes) -> None:
+        self.written.append((offset, data))
+
+
+@pytest.fixture
+def computer():
+    computer = SEQ(32, 1024)
+    computer.add_device(0x100, Register())
+    computer.add_device(0x200, Register())
+    return computer
+
+
+def test_access_inside_device(computer):
+    assert computer.readMem(0x104, 4) == 0x104
+    computer.writeMem(0x200, b'\x01\x02\x03\x04')
+    assert computer.find_device(0x200)[2].written == [(0, b'\x01\x02\x03\x04')]
+
+
+def test_access_outside_devices_is_memory(computer):
+    computer.writeMem(0xf8, b'\x05'*8)
+    assert computer.readMem(0xfc, 4) == 0x05050505
+    assert computer.readMem(0x108, 4) == 0
+    assert computer.find_device(0x1f8, 8) is None
+
+
+@pytest.mark.parametrize('addr, size', [(0xfe, 4), (0x106, 4), (0xfc, 8), (0x1fd, 4), (0xf0, 0x20)])
+def test_partial_overlap_raises(computer, addr, size):
+    with pytest.raises(Exception, match='crosses boundary'):
+        computer.find_device(addr, size)
+    with pytest.raises(Exception, match='crosses boundary'):
+        computer.readMem(addr, size)
+    with pytest.raises(Exception, match='crosses boundary'):
+        computer.writeMem(addr, bytes(size))
+
+
+def test_overlapping_devices_rejected(computer):
+    with pytest.raises(Exception, match='overlaps'):
+        computer.add_device(0x104, Register())
+
+
+def test_compute_slices_rejects_empty_slice(computer):
+    with pytest.raises(Exception):
+        next(computer.compute_slices(0))
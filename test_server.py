@@ -0,0 +1,55 @@
+import asyncio
+import pytest
+from server import SimulationServer
+
+LOOP = '.text\n<main:0x0000>\n.L1\naddri eax, 0x1\njp L1\nhalt\n'
+COUNT = '.text\n<main:0x0000>\nmovri ecx, 0x5\n.L1\naddri eax, 0x2\nsubri ecx, 0x1\njg L1\nhalt\n'
+
+
+def test_run_to_halt():
+    async def scenario():
+        server = SimulationServer()
+        session = (await server.handle({'cmd': 'create'}))['session']
+        await server.handle({'cmd': 'assemble', 'session': session, 'source': COUNT})
+        result = await server.handle({'cmd': 'run', 'session': session})
+        registers = await server.handle({'cmd': 'regs', 'session': session})
+        return result, registers['registers']['eax']
+    result, eax = asyncio.run(scenario())
+    assert result['status'] == 'halted'
+    assert eax == 10
+
+
+def test_run_budget_is_capped():
+    async def scenario():
+        server = SimulationServer(slice_size=100, max_run=1000)
+        session = (await server.handle({'cmd': 'create'}))['session']
+        await server.handle({'cmd': 'assemble', 'session': session, 'source': LOOP})
+        return await server.handle({'cmd': 'run', 'session': session, 'max_instructions': 10**9})
+    result = asyncio.run(scenario())
+    assert result['status'] == 'max_instructions'
+    assert result['instructions'] == 1000
+
+
+def test_close_stops_running_program():
+    async def scenario():
+        server = SimulationServer(slice_size=1000, max_run=10**12)
+        session = (await server.handle({'cmd': 'create'}))['session']
+        await server.handle({'cmd': 'assemble', 'session': session, 'source': LOOP})
+        run = asyncio.create_task(server.handle({'cmd': 'run', 'session': session}))
+        await asyncio.sleep(0.05)
+        await asyncio.wait_for(server.handle({'cmd': 'close', 'session': session}), 5)
+        return await run, server.sessions
+    result, sessions = asyncio.run(scenario())
+    assert result['status'] == 'stopped'
+    assert sessions == {}
+
+
+def test_create_limits():
+    async def scenario():
+        server = SimulationServer(max_memory=4096, max_sessions=1)
+        with pytest.raises(Exception, match='Memory'):
+            await server.handle({'cmd': 'create', 'memory': 1 << 30})
+        await server.handle({'cmd': 'create', 'memory': 4096})
+        with pytest.raises(Exception, match='Too many sessions'):
+            await server.handle({'cmd': 'create'})
+    asyncio.run(scenario())
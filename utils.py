@@ -24,3 +24,24 @@ def twos_components(value: int) -> int:
     elif value >= 0 and not (value & (1 << 31)):
         return value
     return value - (1 << 32)
+
+
+def alu_flags(sign: int, left: int, right: int, result: int) -> dict[str, int]:
+    """
+        Function for deriving condition codes from the last ALU operation
+        def alu_flags(sign: int, left: int, right: int, result: int) -> dict[str, int]
+
+        sign - non zero for subtraction, zero for addition
+        left, right - signed operands, result - signed operation result
+    """
+    mask = (1 << 32) - 1
+    if sign:
+        carry = (left & mask) < (right & mask)  # borrow
+    else:
+        carry = (left & mask) + (right & mask) > mask
+    return {
+        'ZF': int(result == 0),
+        'SF': int(result < 0),
+        'OF': int(result >= (1 << 32) or result < -(1 << 32)),
+        'CF': int(carry),
+    }